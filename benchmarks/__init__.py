@@ -0,0 +1 @@
+''' Microbenchmarks for the crawler hot paths, see benchmarks/run.py. '''
@@ -0,0 +1,80 @@
+import cbor
+import random
+
+from collections import Counter
+from itertools import accumulate
+
+from utils.cache_stub import encode_response
+from utils.response import Response
+
+HOSTS = (
+    "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu",
+    "www.stat.uci.edu", "vision.ics.uci.edu", "wics.ics.uci.edu")
+# Links the scraper is expected to drop, mixed into pages and url lists.
+INVALID_URLS = (
+    "https://www.ics.uci.edu/files/report{}.pdf",
+    "https://example.com/page{}",
+    "https://grape.ics.uci.edu/wiki/{}",
+    "https://www.ics.uci.edu/~eppstein/pix/{}.html",
+    "https://www.ics.uci.edu/events/2024-05-{}",
+    "https://www.ics.uci.edu/calendar?ical={}",
+    "mailto:someone{}@uci.edu")
+
+
+class ZipfVocabulary(object):
+    ''' Words w0, w1, ... drawn with probability proportional to
+        1 / rank ** exponent, the shape of word counts in real pages. '''
+    def __init__(self, size=50000, exponent=1.1, seed=0):
+        self.words = [f"w{rank}" for rank in range(size)]
+        self.cum_weights = list(accumulate(
+            1.0 / (rank + 1) ** exponent for rank in range(size)))
+        self.rng = random.Random(seed)
+
+    def sample(self, count):
+        return self.rng.choices(self.words, cum_weights=self.cum_weights, k=count)
+
+    def text(self, count):
+        return " ".join(self.sample(count))
+
+    def token_counts(self, count):
+        ''' Token dict of a page with count words, as tokenize returns it. '''
+        return dict(Counter(self.sample(count)))
+
+
+def make_urls(count, invalid_share=0.1, seed=0):
+    ''' count distinct urls, invalid_share of them rejected by is_valid. '''
+    rng = random.Random(seed)
+    urls = list()
+    for idx in range(count):
+        if rng.random() < invalid_share:
+            urls.append(rng.choice(INVALID_URLS).format(idx))
+        else:
+            query = f"?page={idx % 7}&sort=name" if rng.random() < 0.2 else ""
+            urls.append(f"https://{rng.choice(HOSTS)}/dir{idx % 97}/page{idx}.html{query}")
+    return urls
+
+
+def make_page(vocabulary, words, links, seed=0):
+    ''' An html page with about words visible words and links anchors, split
+        into paragraphs with the anchors spread between them. '''
+    rng = random.Random(seed)
+    urls = make_urls(links, seed=seed)
+    parts = ["<html><head><title>page</title>",
+             "<script>var tracker = {id: 1};</script></head><body>"]
+    paragraphs = max(1, links // 5)
+    for idx in range(paragraphs):
+        parts.append(f"<p>{vocabulary.text(words // paragraphs)}</p>")
+        for url in urls[idx::paragraphs]:
+            parts.append(f'<a href="{url}">{rng.choice(vocabulary.words[:100])}</a>')
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def make_resp_dict(url, content, content_type="text/html"):
+    ''' The decoded CBOR dict the cache server sends for url. '''
+    return cbor.loads(encode_response(url, 200, content, content_type))
+
+
+def make_response(url, content):
+    ''' Response as the downloader builds it from the cache server. '''
+    return Response(make_resp_dict(url, content))
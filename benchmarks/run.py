@@ -0,0 +1,308 @@
+''' Times the crawler hot paths on synthetic corpora.
+
+        python -m benchmarks.run --output results.json
+        python -m benchmarks.run --baseline results.json
+
+    Results are written as JSON, one entry per case with the median and best
+    microseconds per operation. With --baseline every case is compared with
+    the stored result and the run fails when one got slower than --threshold.
+'''
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from contextlib import redirect_stdout
+from statistics import median
+
+from benchmarks.corpora import ZipfVocabulary, make_urls, make_page, make_response, make_resp_dict
+from crawler import similarity
+from utils import get_urlhash
+from utils.config import Config
+from utils.response import Response
+from utils.tokenizer import tokenize
+
+import scraper
+
+FULL_SIZES = {
+    "tokenize_words": (1000, 10000, 100000),
+    "pages": ((5000, 20), (5000, 200), (50000, 200)),
+    "stored_fingerprints": (10000, 100000),
+    "frontier_sizes": (1000, 10000, 100000),
+    "fingerprint_tokens": (100, 1000, 5000),
+    "response_bytes": (10000, 1000000, 10000000),
+}
+QUICK_SIZES = {
+    "tokenize_words": (1000, 10000),
+    "pages": ((5000, 20), (5000, 200)),
+    "stored_fingerprints": (10000,),
+    "frontier_sizes": (1000, 10000),
+    "fingerprint_tokens": (100, 1000),
+    "response_bytes": (10000, 1000000),
+}
+
+
+def measure(run, ops, repeat, setup=None):
+    ''' Runs run(setup()) repeat times and returns the time per operation
+        in microseconds. setup is not timed. '''
+    times = list()
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - start)
+    return {
+        "ops": ops, "repeat": repeat,
+        "median_us": median(times) / ops * 1e6,
+        "best_us": min(times) / ops * 1e6}
+
+
+def bench_tokenize(options, vocabulary):
+    for words in options["tokenize_words"]:
+        text = vocabulary.text(words)
+        yield f"tokenize/words={words}", measure(
+            lambda _: tokenize(text), 1, options["repeat"])
+
+
+def bench_extract_next_links(options, vocabulary):
+    for words, links in options["pages"]:
+        url = "https://www.ics.uci.edu/index.html"
+        resp = make_response(url, make_page(vocabulary, words, links))
+        yield f"extract_next_links/words={words},links={links}", measure(
+            lambda _: scraper.extract_next_links(url, resp), 1,
+            options["repeat"])
+
+
+def bench_response(options, vocabulary):
+    # A pdf body: the scraper only needs its headers to skip it.
+    for size in options["response_bytes"]:
+        resp_dict = make_resp_dict(
+            "https://www.ics.uci.edu/report.pdf", bytes(size), "application/pdf")
+        yield f"response.headers/bytes={size}", measure(
+            lambda _: Response(resp_dict).headers.get("Content-Type"), 1,
+            options["repeat"])
+
+
+def bench_is_valid(options, vocabulary):
+    urls = make_urls(10000)
+    url_filter = scraper.URL_FILTER
+
+    def clear_caches():
+        url_filter.url_ok.cache_clear()
+        url_filter.netloc_ok.cache_clear()
+        url_filter.path_ok.cache_clear()
+
+    def run(_):
+        for url in urls:
+            scraper.is_valid(url)
+
+    yield "is_valid/cold", measure(run, len(urls), options["repeat"], clear_caches)
+    yield "is_valid/warm", measure(run, len(urls), options["repeat"])
+    yield "validate_many/cold", measure(
+        lambda _: scraper.validate_many(urls), len(urls), options["repeat"],
+        clear_caches)
+
+
+def bench_get_urlhash(options, vocabulary):
+    urls = make_urls(10000)
+
+    def run(_):
+        for url in urls:
+            get_urlhash(url)
+
+    yield "get_urlhash", measure(run, len(urls), options["repeat"])
+
+
+def bench_page_fingerprint(options, vocabulary):
+    for tokens in options["fingerprint_tokens"]:
+        pages = [vocabulary.token_counts(tokens * 4) for _ in range(20)]
+
+        def run(_):
+            for page in pages:
+                similarity.page_fingerprint(page)
+
+        yield f"page_fingerprint/words={tokens * 4}", measure(
+            run, len(pages), options["repeat"])
+
+
+def _reset_similarity(digests=(), fingerprints=()):
+    similarity.seen_digests.clear()
+    similarity.seen_index = similarity.SimhashIndex(similarity.near_threshold)
+    similarity.restore_state(list(digests), list(fingerprints))
+
+
+def bench_check_duplicate(options, vocabulary):
+    rng = random.Random(0)
+    probes = [vocabulary.token_counts(1000) for _ in range(200)]
+    for stored in options["stored_fingerprints"]:
+        digests = [f"{rng.getrandbits(256):064x}" for _ in range(stored)]
+        fingerprints = [rng.getrandbits(64) for _ in range(stored)]
+
+        def run(_):
+            for page in probes:
+                similarity.check_duplicate(page)
+
+        yield f"check_duplicate/stored={stored}", measure(
+            run, len(probes), options["repeat"],
+            lambda: _reset_similarity(digests, fingerprints))
+    _reset_similarity()
+
+
+def make_config(config_file, save_file):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    cparser["LOCAL PROPERTIES"]["SAVE"] = save_file
+    cparser["CRAWLER"]["POLITENESS"] = "0"
+    # Config prints the user agent; stdout may be carrying the JSON results.
+    with redirect_stdout(sys.stderr):
+        config = Config(cparser)
+    config.cache_server = ("127.0.0.1", 0)
+    return config
+
+
+def bench_frontier(options, vocabulary, ops=1000):
+    from crawler.frontier import Frontier
+    with tempfile.TemporaryDirectory() as tmp:
+        config = make_config(options["config_file"], os.path.join(tmp, "frontier"))
+        frontier = Frontier(config, True)
+        # Hosts are spread out so the scheduler never holds a url back.
+        counter = iter(range(10 ** 9))
+
+        def new_urls(count):
+            return [
+                f"https://h{idx % 5000}.ics.uci.edu/page{idx}"
+                for idx in (next(counter) for _ in range(count))]
+
+        def take(_=None):
+            urls = list()
+            while len(urls) < ops:
+                url, wait = frontier.poll_tbd_url()
+                frontier.mark_url_downloaded(url)
+                urls.append(url)
+            return urls
+
+        for size in options["frontier_sizes"]:
+            for url in new_urls(size - len(frontier.store)):
+                frontier.add_url(url)
+            batches = list()
+
+            def add(_):
+                batch = new_urls(ops)
+                for url in batch:
+                    frontier.add_url(url)
+                batches.append(batch)
+
+            def add_again(_):
+                for url in batches[-1]:
+                    frontier.add_url(url)
+
+            def complete(urls):
+                for url in urls:
+                    frontier.mark_url_complete(url)
+
+            yield f"frontier.add_url/size={size}", measure(add, ops, options["repeat"])
+            yield f"frontier.add_url_seen/size={size}", measure(
+                add_again, ops, options["repeat"])
+            yield f"frontier.mark_url_complete/size={size}", measure(
+                complete, ops, options["repeat"], take)
+        frontier.close()
+
+
+BENCHMARKS = {
+    "tokenize": bench_tokenize,
+    "extract_next_links": bench_extract_next_links,
+    "response": bench_response,
+    "is_valid": bench_is_valid,
+    "get_urlhash": bench_get_urlhash,
+    "page_fingerprint": bench_page_fingerprint,
+    "check_duplicate": bench_check_duplicate,
+    "frontier": bench_frontier,
+}
+
+
+def run_benchmarks(names, quick=False, repeat=5, config_file="config.ini"):
+    options = dict(
+        QUICK_SIZES if quick else FULL_SIZES,
+        repeat=repeat, config_file=config_file)
+    vocabulary = ZipfVocabulary()
+    results = dict()
+    for name in names:
+        for case, result in BENCHMARKS[name](options, vocabulary):
+            results[case] = result
+            print(f"{case:<48} {result['median_us']:>12.2f} us/op", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": similarity.np is not None,
+            "quick": quick,
+            "repeat": repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results}
+
+
+def compare(current, baseline, threshold):
+    ''' Prints current against baseline and returns the cases that got
+        slower by more than threshold (0.1 is 10%). '''
+    regressions = list()
+    print(f"{'case':<48} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for case, result in current["results"].items():
+        before = baseline["results"].get(case)
+        if before is None:
+            print(f"{case:<48} {'-':>12} {result['median_us']:>12.2f} {'new':>7}")
+            continue
+        ratio = result["median_us"] / before["median_us"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  slower"
+            regressions.append(case)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(
+            f"{case:<48} {before['median_us']:>12.2f} "
+            f"{result['median_us']:>12.2f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description="Crawler hot path benchmarks.")
+    parser.add_argument(
+        "--only", type=str, default=",".join(BENCHMARKS),
+        help=f"comma separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", default=False)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--baseline", type=str, default=None)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+    names = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks {', '.join(sorted(unknown))}.")
+    # Keeps the frontier's startup and shutdown logs out of the output.
+    logging.disable(logging.INFO)
+    current = run_benchmarks(names, args.quick, args.repeat, args.config_file)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(current, output_file, indent=2, sort_keys=True)
+    else:
+        json.dump(current, sys.stdout, indent=2, sort_keys=True)
+        print()
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} cases slower than the baseline.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
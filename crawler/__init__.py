@@ -1,19 +1,31 @@
 from utils import get_logger
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler import parse_pool
+from utils import metrics, logs
+import scraper
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
+        logs.configure(config)
+        scraper.MAX_PARSE_BYTES = config.max_parse_bytes
         self.logger = get_logger("CRAWLER")
+        self.metrics = metrics.configure(config, self.logger)
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
         self.worker_factory = worker_factory
 
     def start_async(self):
-        self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
-            for worker_id in range(self.config.threads_count)]
+        self.metrics.start()
+        if self.config.engine == "asyncio":
+            # One event loop thread runs all fetches as asyncio tasks.
+            from crawler.async_crawler import AsyncCrawl
+            self.workers = [AsyncCrawl(self.config, self.frontier)]
+        else:
+            self.workers = [
+                self.worker_factory(worker_id, self.config, self.frontier)
+                for worker_id in range(self.config.threads_count)]
         for worker in self.workers:
             worker.start()
 
@@ -24,3 +36,5 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+        parse_pool.shutdown()
+        self.metrics.stop()
@@ -0,0 +1,111 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from crawler import parse_pool
+from crawler.worker import handle_response, download_sampler, log_download
+from utils import get_logger
+from utils.download import AsyncDownloader
+
+
+class AsyncCrawl(Thread):
+    ''' Runs the crawl as asyncio fetch tasks on one event loop thread.
+
+        One dispatcher takes urls whose host is ready from the frontier and
+        hands each to an idle fetch task. When no host is ready it sleeps
+        until the next host timer expires or the frontier's scheduler
+        signals that urls were added or released, so politeness never
+        blocks a thread and idle tasks never poll. Frontier calls run on a
+        thread of their own, and scraping and frontier updates in a thread
+        pool, so neither stalls the event loop. '''
+    def __init__(self, config, frontier):
+        self.logger = get_logger("ASYNC-CRAWLER", "Worker")
+        self.config = config
+        self.frontier = frontier
+        # Every fetch task runs on the event loop thread, so they share it.
+        self.sampler = download_sampler(config)
+        # Set, and replaced by a new one, when the scheduler changes.
+        self.wake = None
+        self.wake_pending = False
+        super().__init__(daemon=True)
+
+    def run(self):
+        asyncio.run(self.crawl())
+
+    async def crawl(self):
+        loop = asyncio.get_running_loop()
+        pool = parse_pool.get_pool(self.config)
+        self.wake = asyncio.Event()
+        urls = asyncio.Queue()
+        idle = asyncio.Semaphore(self.config.async_tasks)
+        scheduler = self.frontier.scheduler
+        scheduler.on_change = lambda: self._signal(loop)
+        try:
+            with ThreadPoolExecutor(self.config.threads_count) as executor, \
+                    ThreadPoolExecutor(1) as frontier_executor:
+                async with AsyncDownloader(self.config, self.logger) as downloader:
+                    await asyncio.gather(
+                        self.dispatch(loop, frontier_executor, urls, idle),
+                        *(self.fetch_loop(
+                            loop, executor, frontier_executor, downloader, pool,
+                            urls, idle)
+                          for _ in range(self.config.async_tasks)))
+        finally:
+            scheduler.on_change = None
+        self.logger.info("Frontier is empty. Stopping Crawler.")
+
+    def _signal(self, loop):
+        # Called by the scheduler, on any thread, with its lock held. One
+        # wake-up is scheduled at a time however many changes come in.
+        if not self.wake_pending:
+            self.wake_pending = True
+            loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self.wake_pending = False
+        wake, self.wake = self.wake, asyncio.Event()
+        wake.set()
+
+    async def dispatch(self, loop, frontier_executor, urls, idle):
+        # Takes a url from the frontier whenever a fetch task is idle.
+        while True:
+            await idle.acquire()
+            while True:
+                # Taken before polling, so a change after the poll sets it.
+                wake = self.wake
+                tbd_url, wait = await loop.run_in_executor(
+                    frontier_executor, self.frontier.poll_tbd_url)
+                if tbd_url is not None or wait is None:
+                    break
+                try:
+                    await asyncio.wait_for(wake.wait(), wait if wait > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+            if tbd_url is None:
+                for _ in range(self.config.async_tasks):
+                    urls.put_nowait(None)
+                return
+            urls.put_nowait(tbd_url)
+
+    async def fetch_loop(self, loop, executor, frontier_executor, downloader, pool, urls, idle):
+        while True:
+            tbd_url = await urls.get()
+            if tbd_url is None:
+                return
+            try:
+                resp = None
+                try:
+                    resp = await downloader.download(tbd_url)
+                finally:
+                    await loop.run_in_executor(
+                        frontier_executor, self.frontier.mark_url_downloaded,
+                        tbd_url, resp)
+                log_download(self.logger, self.sampler, self.config, tbd_url, resp)
+                await loop.run_in_executor(
+                    executor, handle_response, self.frontier, tbd_url, resp, pool)
+            except Exception:
+                self.logger.exception(f"Failed to process {tbd_url}.")
+            await loop.run_in_executor(
+                executor, self.frontier.mark_url_complete, tbd_url)
+            idle.release()
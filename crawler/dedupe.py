@@ -0,0 +1,100 @@
+import os
+import sys
+
+from array import array
+from threading import Lock
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DIGEST_SIZE = 32
+FINGERPRINT_SIZE = 8
+
+
+class DedupeLog(object):
+    ''' Append-only record of the pages kept by crawler.similarity.
+
+        Content digests go to <path>.digests as raw 32 byte records and
+        simhash fingerprints to <path>.fingerprints as a packed little
+        endian uint64 array, one record per new page. '''
+    def __init__(self, path):
+        self.digest_path = f"{path}.digests"
+        self.fingerprint_path = f"{path}.fingerprints"
+        self.lock = Lock()
+        self.digest_file = None
+        self.fingerprint_file = None
+
+    def remove(self):
+        for path in (self.digest_path, self.fingerprint_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load(self):
+        ''' Returns (digests, fingerprints) as stored. A record that was only
+            half written before a crash is dropped. '''
+        count = min(
+            self._size(self.digest_path) // DIGEST_SIZE,
+            self._size(self.fingerprint_path) // FINGERPRINT_SIZE)
+        if not count:
+            return [], []
+        with open(self.digest_path, "rb") as digest_file:
+            raw = digest_file.read(count * DIGEST_SIZE)
+        digests = [
+            raw[idx:idx + DIGEST_SIZE].hex()
+            for idx in range(0, len(raw), DIGEST_SIZE)]
+        if np is not None:
+            fingerprints = np.memmap(
+                self.fingerprint_path, dtype="<u8", mode="r",
+                shape=(count,)).tolist()
+        else:
+            fingerprints = array("Q")
+            with open(self.fingerprint_path, "rb") as fingerprint_file:
+                fingerprints.frombytes(
+                    fingerprint_file.read(count * FINGERPRINT_SIZE))
+            if sys.byteorder == "big":
+                fingerprints.byteswap()
+            fingerprints = fingerprints.tolist()
+        self._truncate(count)
+        return digests, fingerprints
+
+    @staticmethod
+    def _size(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _truncate(self, count):
+        for path, size in (
+                (self.digest_path, DIGEST_SIZE),
+                (self.fingerprint_path, FINGERPRINT_SIZE)):
+            if self._size(path) > count * size:
+                with open(path, "r+b") as log_file:
+                    log_file.truncate(count * size)
+
+    def _open(self):
+        # Caller holds self.lock.
+        if self.digest_file is None:
+            self.digest_file = open(self.digest_path, "ab")
+            self.fingerprint_file = open(self.fingerprint_path, "ab")
+
+    def append(self, digest, fingerprint):
+        self.extend([(digest, fingerprint)])
+
+    def extend(self, records):
+        with self.lock:
+            self._open()
+            for digest, fingerprint in records:
+                self.digest_file.write(bytes.fromhex(digest))
+                self.fingerprint_file.write(
+                    fingerprint.to_bytes(FINGERPRINT_SIZE, "little"))
+            self.digest_file.flush()
+            self.fingerprint_file.flush()
+
+    def close(self):
+        with self.lock:
+            for log_file in (self.digest_file, self.fingerprint_file):
+                if log_file is not None:
+                    os.fsync(log_file.fileno())
+                    log_file.close()
+            self.digest_file = None
+            self.fingerprint_file = None
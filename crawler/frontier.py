@@ -1,32 +1,64 @@
 from collections import Counter, defaultdict
+from contextlib import contextmanager
 import os
 import shelve
+import time
 
-from threading import RLock, Lock
+from threading import RLock, Lock, Event, Thread
 from queue import Queue, Empty
 
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from utils import get_logger, get_urlhash, normalize, canonicalize
+from utils.metrics import get_metrics
+from scraper import validate_many
+from crawler.store import TBD, open_store
+from crawler.stats import CrawlStats
+from crawler.tokens import TokenCounts
+from crawler.scheduler import HostScheduler
+from crawler.dedupe import DedupeLog
+from crawler.seen import SeenFilter
+from crawler.spill import SpillSegments
+from crawler.traps import TrapDetector
+from crawler.rate import RateController, retry_after
+from crawler.pages import open_pages
+from crawler import similarity
 
 SUB_COUNT = "subdomain_count"
 TOKENS = "tokens"
-TBD = "tbd"
 LONGEST_PAGE_KEY = "longest_page"
 EXACT_HASHES_KEY = "similarity_exact_hashes"
 SIMHASH_LIST_KEY = "similarity_simhash_list"
 
+def print_report(subdomain_counts, tokens, longest):
+    # The end of crawl report, also printed for the merged shards.
+    print(f"Total unique pages = {sum(subdomain_counts.values())}")
+    print(f"Longest page: {longest[1]} ({longest[0]} words)")
+    print("50 most common words:")
+    print(tokens.most_common(50))
+    print("Subdomains:")
+    for subdomain, count in sorted(subdomain_counts.items(), key=lambda item: item[0]):
+        print(f"{subdomain}, {count}")
+
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
-        self.domain_locks = dict()
-        self.tbd_lock = Lock()
-        self.count_lock = Lock()
-        self.token_lock = Lock()
-        self.longest_lock = Lock()
-        self.locks_lock = Lock()
-        self.simhash_lock = Lock()
+        self.metrics = get_metrics()
+        # Urls past frontier_memory_urls wait on disk in <SAVE>.spill.
+        self.spill = (
+            SpillSegments(f"{self.config.save_file}.spill", self.config.frontier_segment_urls)
+            if self.config.frontier_memory_urls else None)
+        self.scheduler = HostScheduler(
+            self.config.time_delay, self.metrics.wrap_lock("scheduler", Lock()),
+            self.config.frontier_memory_urls, self.spill)
+        # Per-host delays between time_delay and max_time_delay.
+        self.rate = (
+            RateController(self.config.time_delay, self.config.max_time_delay, self.metrics)
+            if self.config.adaptive_politeness else None)
+        self.tbd_lock = self.metrics.wrap_lock("frontier", Lock())
+        self.metrics.gauge("crawler_frontier_queued", lambda: self.scheduler.queued)
+        self.metrics.gauge("crawler_frontier_in_flight", lambda: self.scheduler.in_flight)
+        self.metrics.gauge("crawler_frontier_hosts", lambda: len(self.scheduler.queues))
+        self.seen = SeenFilter()
         
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
@@ -38,144 +70,287 @@ class Frontier(object):
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
             os.remove(self.config.save_file)
+        self.started = time.perf_counter()
+        self.startup_times = list()
+        self.first_url_after = None
+        self.loaders = list()
+        self.dedupe_ready = Event()
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
-        try:
-            import similarity
-            digests = self.save.get(EXACT_HASHES_KEY)
-            fingerprints = self.save.get(SIMHASH_LIST_KEY)
-            similarity.restore_state(digests, fingerprints)
-        except ImportError:
-            pass
+        with self._timed("open save"):
+            self.save = shelve.open(self.config.save_file)
+            self.store = open_store(self.config, self.save, restart)
+        self.stats = CrawlStats(
+            self.config.stats_file, self.config.checkpoint_pages,
+            self.config.checkpoint_seconds, self.logger,
+            self.config.token_top_words, self.config.token_sketch_width)
+        if restart and os.path.exists(self.config.stats_file):
+            os.remove(self.config.stats_file)
+        self.dedupe_log = DedupeLog(self.config.dedupe_file)
+        self.traps = (
+            TrapDetector(self.config.traps_file, restart, self.logger)
+            if self.config.trap_detection else None)
+        # Last visit of every page and when to visit it again, for RECRAWL.
+        self.pages = open_pages(self.config, restart) if self.config.recrawl else None
         
         if restart:
-            self.save[SUB_COUNT] = {}
-            self.save[TOKENS] = Counter()
-            self.save[TBD] = dict()
-            self.save[LONGEST_PAGE_KEY] = (0, "")
-            self.save[EXACT_HASHES_KEY] = []
-            self.save[SIMHASH_LIST_KEY] = []
-            self.save.sync()
+            self.dedupe_log.remove()
+            self.dedupe_ready.set()
+            if self.config.store == "shelve":
+                self.save[TBD] = dict()
+                self.save.sync()
             for url in self.config.seed_urls:
                 self.add_url(url)
         else:   
-            self._parse_save_file()
-            if SUB_COUNT not in self.save:
-                self.save[SUB_COUNT] = {}
-            if TOKENS not in self.save:
-                self.save[TOKENS] = Counter()
-            if LONGEST_PAGE_KEY not in self.save:
-                self.save[LONGEST_PAGE_KEY] = (0, "")
-            if EXACT_HASHES_KEY not in self.save:
-                self.save[EXACT_HASHES_KEY] = []
-            if SIMHASH_LIST_KEY not in self.save:
-                self.save[SIMHASH_LIST_KEY] = []
-            self.save.sync()
-            if not self.save[TBD]:
+            with self._timed("load stats"):
+                if not self.stats.load():
+                    # Older saves kept the aggregates inside the shelve file.
+                    self.stats.restore((
+                        self.save.get(SUB_COUNT, {}),
+                        self.save.get(TOKENS, Counter()),
+                        self.save.get(LONGEST_PAGE_KEY, (0, ""))))
+            # Hosts keep their place in the host order across restarts.
+            self.scheduler.add_host_pages(self.stats.get_subdomain_count())
+            # Taken before seeding so the loader does not queue seeds twice.
+            pending = self.store.pending(self.config.load_batch_size)
+            if not len(self.store):
                 for url in self.config.seed_urls:
                     self.add_url(url)
+            # Saved urls and the dedupe history load on background threads
+            # so workers can start fetching while the rest is read.
+            self.scheduler.start_loading()
+            self.loaders = [
+                Thread(target=self._restore_dedupe, daemon=True),
+                Thread(target=self._parse_save_file, args=(pending,), daemon=True)]
+            for loader in self.loaders:
+                loader.start()
+        self.stats.start()
+
+    @contextmanager
+    def _timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_times.append((phase, time.perf_counter() - start))
+
+    def _report_startup(self):
+        phases = ", ".join(
+            f"{phase} {seconds:.2f}s" for phase, seconds in self.startup_times)
+        first_url = (
+            f"first saved url queued after {self.first_url_after:.2f}s, "
+            if self.first_url_after is not None else "")
+        self.logger.info(
+            f"Startup phases: {phases}; {first_url}loading finished after "
+            f"{time.perf_counter() - self.started:.2f}s.")
+
+    def _restore_dedupe(self):
+        try:
+            with self._timed("restore dedupe"):
+                digests, fingerprints = self.dedupe_log.load()
+                if not digests and self.save.get(SIMHASH_LIST_KEY):
+                    # Older saves re-pickled the whole dedupe state into shelve.
+                    digests = self.save.get(EXACT_HASHES_KEY, [])
+                    fingerprints = self.save[SIMHASH_LIST_KEY]
+                    self.dedupe_log.extend(zip(digests, fingerprints))
+                similarity.restore_state(digests, fingerprints)
+        finally:
+            self.dedupe_ready.set()
 
-    def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save[TBD])
+    def _parse_save_file(self, pending):
+        ''' This function can be overridden for alternate saving techniques.
+            Runs on a loader thread and queues the saved pending urls one
+            batch at a time, so fetching starts after the first batch. '''
         tbd_count = 0
-        for url, completed in self.save[TBD].values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
+        try:
+            with self._timed("load pending urls"):
+                for batch in pending:
+                    for urlhash, url in batch:
+                        self.seen.add(urlhash)
+                    for url in validate_many(url for urlhash, url in batch):
+                        self.scheduler.put(url)
+                        tbd_count += 1
+                    if tbd_count and self.first_url_after is None:
+                        self.first_url_after = time.perf_counter() - self.started
+            if self.pages is not None:
+                # After the pending urls, so none of them is queued twice.
+                with self._timed("queue revisits"):
+                    revisits = self._queue_revisits()
+                self.logger.info(f"Queued {revisits} pages due for a revisit.")
+        finally:
+            self.scheduler.finish_loading()
         self.logger.info(
-            f"Found {tbd_count} urls to be downloaded from {total_count} "
+            f"Found {tbd_count} urls to be downloaded from {len(self.store)} "
             f"total urls discovered.")
+        self.dedupe_ready.wait()
+        self._report_startup()
+
+    def _queue_revisits(self):
+        # Completed urls whose revisit is due are pending again, so a crash
+        # does not lose them.
+        revisits = 0
+        for batch in self.pages.due(self.config.load_batch_size):
+            for urlhash, url in batch:
+                with self.tbd_lock:
+                    reopened = self.store.reopen(urlhash)
+                if reopened:
+                    self.seen.add(urlhash)
+                    self.scheduler.put(url)
+                    revisits += 1
+        return revisits
 
     def get_tbd_url(self):
-        try:
-            with self.tbd_lock:
-                return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        # Blocks until a url whose host may be fetched is available.
+        while True:
+            url = self.scheduler.get()
+            if url is None or not self._skip_trap(url):
+                return url
+
+    def poll_tbd_url(self):
+        # Non-blocking variant of get_tbd_url, see HostScheduler.poll.
+        while True:
+            url, wait = self.scheduler.poll()
+            if url is None or not self._skip_trap(url):
+                return url, wait
+
+    def _skip_trap(self, url):
+        # A url queued before its pattern turned out to be a trap is marked
+        # complete without being fetched.
+        if self.traps is None or not self.traps.is_trap(url):
+            return False
+        with self.tbd_lock:
+            self.store.complete(get_urlhash(url), url)
+        self.scheduler.discard(url)
+        return True
 
-    def add_url(self, url):
-        url = normalize(url)
+    def add_url(self, url, depth=0):
+        # depth is the number of links from a seed or saved url.
+        raw_url = normalize(url)
+        url = canonicalize(url)
         urlhash = get_urlhash(url)
+        raw_urlhash = urlhash if raw_url == url else get_urlhash(raw_url)
+        # Most links were added before; drop them without the lock or store.
+        if self.seen.seen(urlhash, raw_urlhash):
+            return
+        if self.traps is not None and not self.traps.allow(url):
+            # Remembered so later links to it are dropped as seen.
+            self.seen.add(urlhash)
+            return
         with self.tbd_lock:
-            if urlhash not in self.save[TBD]:
-                tbd = self.save[TBD]
-                tbd[urlhash] = (url, False)
-                self.save[TBD] = tbd
-                self.save.sync()
-                self.to_be_downloaded.append(url)
+            if self.store.add(urlhash, url):
+                self.scheduler.put(url, depth)
+        self.seen.add(urlhash)
     
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
         with self.tbd_lock:
-            if urlhash not in self.save[TBD]:
+            if urlhash not in self.store:
                 # This should not happen.
                 self.logger.error(
                     f"Completed url {url}, but have not seen it before.")
-            tbd = self.save[TBD]
-            tbd[urlhash] = (url, True)
-            self.save[TBD] = tbd
-            self.save.sync()
+            self.store.complete(urlhash, url)
+        self.scheduler.done(url)
+
+    def url_depth(self, url):
+        # Depth of a url being processed, for the links found on it.
+        return self.scheduler.depth(url)
+
+    def mark_url_downloaded(self, url, resp=None):
+        # Starts the politeness delay for the url's host, adapted to resp
+        # (None when the download raised) with adaptive politeness.
+        delay = None
+        if self.rate is not None and resp is not None:
+            delay = self.rate.observe(
+                self.scheduler.host_of(url), resp.status, resp.latency,
+                retry_after(resp))
+        self.scheduler.release(url, delay)
     
     def add_subdomain_count(self, domain):
-        with self.count_lock:
-            counts = self.save[SUB_COUNT]
-            counts[domain] = counts.get(domain, 0) + 1
-            self.save[SUB_COUNT] = counts
-            self.save.sync()
+        self.stats.add_subdomain_count(domain)
     
     def get_subdomain_count(self):
-        with self.count_lock:
-            return self.save[SUB_COUNT]
+        return self.stats.get_subdomain_count()
 
     def add_tokens(self, tokens):
-        with self.token_lock:
-            self.save[TOKENS] += Counter(tokens)
-            self.save.sync()
+        self.stats.add_tokens(tokens)
     
     def get_tokens(self):
-        with self.token_lock:
-            return self.save[TOKENS]
+        return self.stats.get_tokens()
+
+    def top_tokens(self, n=50):
+        # Safe to call while the crawl runs.
+        return self.stats.top_tokens(n)
 
     def update_longest_page(self, url, tokens):
         """Update longest page if this page has more words. tokens is word -> count dict."""
         word_count = sum(tokens.values()) if tokens else 0
         if word_count <= 0:
             return
-        with self.longest_lock:
-            current = self.save.get(LONGEST_PAGE_KEY, (0, ""))
-            if word_count > current[0]:
-                self.save[LONGEST_PAGE_KEY] = (word_count, url)
-                self.save.sync()
+        self.stats.update_longest_page(url, word_count)
 
-    def is_duplicate_page(self, tokens):
-        try:
-            import similarity
-        except ImportError:
+    def record_page(self, url, wasted):
+        # Feeds the trap detector; wasted pages are duplicates of pages
+        # fetched before. Error responses are not recorded.
+        if self.traps is not None:
+            self.traps.record_page(url, wasted)
+
+    def previous_visit(self, url):
+        # The Page saved by the last visit of url with RECRAWL, else None.
+        if self.pages is None:
+            return None
+        return self.pages.get(get_urlhash(url))
+
+    def record_visit(self, url, previous, validators, digest, links):
+        # links None keeps the links of the previous visit.
+        self.pages.visit(get_urlhash(url), url, previous, *validators, digest, links)
+
+    def revisit_unchanged(self, url, previous, validators):
+        # The page is the same as last time: it is not parsed or counted
+        # again, and the links it had are added from the page store.
+        self.record_visit(url, previous, validators, previous.digest, None)
+        depth = self.url_depth(url) + 1
+        for link in previous.links():
+            self.add_url(link, depth)
+
+    def is_duplicate_page(self, tokens, digest=None, fingerprint=None):
+        # A page without tokens (too little text, not html) has nothing to
+        # compare, and its links are still followed.
+        if not tokens:
             return False
-        if similarity.check_duplicate(tokens):
+        # Pages fetched while resuming wait for the dedupe history.
+        self.dedupe_ready.wait()
+        stored = similarity.check_and_insert(tokens, digest, fingerprint)
+        if stored is None:
             return True
-        with self.simhash_lock:
-            digests, fingerprints = similarity.get_state_for_save()
-            self.save[EXACT_HASHES_KEY] = digests
-            self.save[SIMHASH_LIST_KEY] = fingerprints
-            self.save.sync()
+        self.dedupe_log.append(*stored)
         return False
 
     def print_data(self):
         subdomain_counts: dict = self.get_subdomain_count()
-        tokens: Counter = self.get_tokens()
-        longest = self.save.get(LONGEST_PAGE_KEY, (0, ""))
-        print(f"Total unique pages = {sum(subdomain_counts.values())}")
-        print(f"Longest page: {longest[1]} ({longest[0]} words)")
-        print("50 most common words:")
-        print(tokens.most_common(50))
-        print("Subdomains:")
-        for subdomain, count in sorted(subdomain_counts.items(), key=lambda item: item[0]):
-            print(f"{subdomain}, {count}")
-    
-    def get_domain_lock(self, domain):
-        with self.locks_lock:
-            if domain not in self.domain_locks:
-                self.domain_locks[domain] = Lock()
-            return self.domain_locks[domain]
\ No newline at end of file
+        tokens: TokenCounts = self.get_tokens()
+        longest = self.stats.get_longest_page()
+        self.logger.info(
+            f"Word counts: {len(tokens)} words ranked out of {tokens.total} "
+            f"tokens; a count is at most {tokens.error_bound} too high.")
+        print_report(subdomain_counts, tokens, longest)
+
+    def close(self):
+        for loader in self.loaders:
+            loader.join()
+        self.logger.info(
+            f"Seen filter holds {len(self.seen)} urls, dropped "
+            f"{self.seen.duplicates} duplicate links in memory, "
+            f"{self.seen.saved_fetches} of them only after canonicalization.")
+        if self.traps is not None:
+            self.logger.info(f"Trap detector: {self.traps.summary()}")
+            self.traps.close()
+        if self.rate is not None:
+            self.logger.info(f"Politeness: {self.rate.summary()}")
+        if self.pages is not None:
+            self.logger.info(f"Recrawl: {self.pages.summary()}")
+            self.pages.close()
+        self.stats.stop()
+        self.dedupe_log.close()
+        self.store.close()
+        self.save.close()
+        if self.spill is not None:
+            self.spill.remove()
\ No newline at end of file
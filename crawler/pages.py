@@ -0,0 +1,162 @@
+import time
+import zlib
+
+from hashlib import sha1
+
+from crawler.store import SqliteDatabase
+
+
+class Page(object):
+    ''' What the last visit of a url found. '''
+    __slots__ = (
+        "url", "body_hash", "digest", "etag", "last_modified", "fetched",
+        "interval", "changes", "visits", "outlinks")
+
+    def __init__(self, url, body_hash, digest, etag, last_modified, fetched,
+                 interval, changes, visits, outlinks):
+        self.url = url
+        self.body_hash = body_hash
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched = fetched
+        self.interval = interval
+        self.changes = changes
+        self.visits = visits
+        self.outlinks = outlinks
+
+    def links(self):
+        ''' The valid links found on the last version of the page. '''
+        if not self.outlinks:
+            return list()
+        return zlib.decompress(self.outlinks).decode("utf-8").split("\n")
+
+
+def validators(resp):
+    ''' (etag, last_modified, body_hash) of a downloaded page. '''
+    headers = resp.headers
+    content = resp.content
+    body_hash = sha1(content).hexdigest() if content is not None else None
+    return headers.get("ETag"), headers.get("Last-Modified"), body_hash
+
+
+def unchanged(page, etag, last_modified, body_hash):
+    ''' True when a page downloaded with these validators is the same as
+        the last visit of it: same ETag, else same Last-Modified, else the
+        same body. '''
+    if etag and page.etag:
+        return etag == page.etag
+    if last_modified and page.last_modified:
+        return last_modified == page.last_modified
+    return body_hash is not None and body_hash == page.body_hash
+
+
+class PageStore(SqliteDatabase):
+    ''' Per-url metadata for incremental recrawls, in its own sqlite file
+        next to the url store: validators and content digest of the last
+        version, when it was fetched, the links it had, and when to visit
+        it again. A visit that finds the page changed halves its revisit
+        interval and adds a row to the changes table; a visit that finds
+        it unchanged doubles it, within min_interval and max_interval. '''
+    def __init__(self, path, min_interval, max_interval, batch_size=500, batch_seconds=1.0):
+        super().__init__(path, batch_size, batch_seconds)
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, body_hash TEXT, "
+            "digest TEXT, etag TEXT, last_modified TEXT, "
+            "fetched REAL NOT NULL, interval REAL NOT NULL, "
+            "next_visit REAL NOT NULL, changes INTEGER NOT NULL DEFAULT 0, "
+            "visits INTEGER NOT NULL DEFAULT 1, outlinks BLOB)")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS pages_next_visit ON pages (next_visit, urlhash)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS changes ("
+            "urlhash TEXT NOT NULL, fetched REAL NOT NULL, digest TEXT)")
+        # Revisits of this run, for the log.
+        self.revisits = {"unchanged": 0, "changed": 0}
+
+    def get(self, urlhash):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT url, body_hash, digest, etag, last_modified, fetched, "
+                "interval, changes, visits, outlinks FROM pages WHERE urlhash = ?",
+                (urlhash,)).fetchone()
+        return Page(*row) if row is not None else None
+
+    def visit(self, urlhash, url, previous, etag, last_modified, body_hash,
+              digest, links=None):
+        ''' Save a visit of url. previous is the Page of the last visit,
+            None for the first. links are the links found, None to keep
+            those of previous. Returns whether the page changed. '''
+        now = time.time()
+        if previous is None:
+            changed, interval, changes, visits = True, self.min_interval, 0, 1
+        else:
+            # Decided like the crawl does, so pages without tokens (whose
+            # digests are all the same) still change with their body.
+            changed = not unchanged(previous, etag, last_modified, body_hash)
+            if changed:
+                interval = max(self.min_interval, previous.interval / 2)
+            else:
+                interval = min(self.max_interval, previous.interval * 2)
+            changes = previous.changes + changed
+            visits = previous.visits + 1
+            self.metrics.inc(
+                "crawler_revisits_total", (("result", "changed" if changed else "unchanged"),))
+        if links is None:
+            outlinks = previous.outlinks
+        else:
+            outlinks = zlib.compress("\n".join(links).encode("utf-8")) if links else None
+        with self.lock:
+            if previous is not None:
+                self.revisits["changed" if changed else "unchanged"] += 1
+            self._write(
+                "INSERT OR REPLACE INTO pages (urlhash, url, body_hash, digest, "
+                "etag, last_modified, fetched, interval, next_visit, changes, "
+                "visits, outlinks) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (urlhash, url, body_hash, digest, etag, last_modified, now,
+                 interval, now + interval, changes, visits, outlinks))
+            if changed:
+                self._write(
+                    "INSERT INTO changes (urlhash, fetched, digest) VALUES (?, ?, ?)",
+                    (urlhash, now, digest))
+        return changed
+
+    def due(self, batch_size):
+        ''' Batches of (urlhash, url) for the pages whose next visit is due
+            now, the longest overdue first. '''
+        now = time.time()
+        last = (float("-inf"), "")
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT next_visit, urlhash, url FROM pages "
+                    "WHERE next_visit <= ? AND (next_visit, urlhash) > (?, ?) "
+                    "ORDER BY next_visit, urlhash LIMIT ?",
+                    (now, last[0], last[1], batch_size)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][:2]
+            yield [(urlhash, url) for _, urlhash, url in rows]
+
+    def history(self, urlhash):
+        ''' (fetch time, digest) of every version of a url seen. '''
+        with self.lock:
+            return self.conn.execute(
+                "SELECT fetched, digest FROM changes WHERE urlhash = ? "
+                "ORDER BY fetched", (urlhash,)).fetchall()
+
+    def summary(self):
+        return (
+            f"{self.revisits['unchanged']} revisited pages unchanged, "
+            f"{self.revisits['changed']} changed.")
+
+
+def open_pages(config, restart):
+    if restart:
+        PageStore.remove(config.pages_file)
+    return PageStore(
+        config.pages_file, config.recrawl_min_interval, config.recrawl_max_interval,
+        config.store_batch_size, config.store_batch_seconds)
@@ -0,0 +1,71 @@
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+import scraper
+from crawler import similarity
+
+_pool = None
+_pool_lock = Lock()
+
+
+def _init_process(max_parse_bytes):
+    # Pool processes import scraper afresh; give them the crawler's cap.
+    scraper.MAX_PARSE_BYTES = max_parse_bytes
+
+
+def parse_job(url, content, content_type):
+    ''' Runs in a pool process: scrape the page and compute the dedupe
+        inputs so the parent only does lookups. '''
+    links, tokens = scraper.parse_content(url, content, content_type)
+    digest = fingerprint = None
+    if tokens:
+        digest = similarity.compute_content_digest(tokens)
+        fingerprint = similarity.page_fingerprint(tokens)
+    return links, tokens, digest, fingerprint
+
+
+class ParsePool(object):
+    ''' Process pool that takes BeautifulSoup parsing, tokenizing and
+        fingerprinting off the GIL of the downloading threads. '''
+    def __init__(self, processes, max_parse_bytes=0):
+        # Spawn rather than fork: the crawler process already runs threads.
+        self.executor = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process, initargs=(max_parse_bytes,))
+
+    def parse(self, url, resp):
+        ''' Returns (links, tokens, digest, fingerprint) for a downloaded
+            response. Blocks the calling thread, not the interpreter. '''
+        if resp.error:
+            return scraper.scraper(url, resp) + (None, None)
+        content_type = resp.headers.get("Content-Type")
+        if not scraper.is_html(content_type):
+            # Nothing to parse; the body is not sent to the pool.
+            return list(), dict(), None, None
+        content = resp.content
+        return self.executor.submit(
+            parse_job, url, content.tobytes() if content is not None else None,
+            content_type).result()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def get_pool(config):
+    ''' The process-wide ParsePool, or None when PARSE_PROCESSES is 0. '''
+    global _pool
+    if config.parse_processes > 0:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ParsePool(config.parse_processes, config.max_parse_bytes)
+    return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
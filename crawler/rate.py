@@ -0,0 +1,118 @@
+from threading import Lock
+
+# Statuses that mean the host is struggling: no response at all, rate
+# limited, and the 5xx server errors of is_backoff_status. The cache
+# server's own 6xx codes (url not allowed, page too large, ...) say nothing
+# about the host and do not slow it down.
+BACKOFF_STATUSES = frozenset([0, 429])
+# The delay of a host is multiplied by this after an error, from at least
+# BACKOFF_MIN_SECONDS so hosts back off with POLITENESS = 0 too ...
+BACKOFF_FACTOR = 2.0
+BACKOFF_MIN_SECONDS = 0.5
+# ... and goes back down by this many seconds after each healthy response.
+RECOVERY_SECONDS = 0.5
+# Weight of the newest response time in the running average.
+LATENCY_WEIGHT = 0.2
+
+
+def is_backoff_status(status):
+    return status in BACKOFF_STATUSES or 500 <= status < 600
+
+
+def retry_after(resp):
+    ''' Seconds from the Retry-After header of a 429 or 503 response, None
+        when there is none or it is an HTTP date. '''
+    if resp.status not in (429, 503):
+        return None
+    try:
+        return max(0.0, float(resp.headers.get("Retry-After", "")))
+    except ValueError:
+        return None
+
+
+class HostRate(object):
+    __slots__ = ("delay", "latency", "errors", "backoffs")
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.latency = None
+        self.errors = 0
+        self.backoffs = 0
+
+
+class RateController(object):
+    ''' Politeness delay per host, adapted to how the host responds (AIMD).
+
+        Every host starts at min_delay. An error response (see
+        is_backoff_status) multiplies its delay, or BACKOFF_MIN_SECONDS
+        when that is larger, by BACKOFF_FACTOR, up to max_delay, or raises
+        it to the Retry-After the server asked for. A healthy response
+        takes RECOVERY_SECONDS off again. The delay never goes below
+        min_delay, so a healthy host is fetched as often as without
+        adaptation.
+
+        Response times are deliberately not part of the delay: a host that
+        answers slowly but correctly is already fetched less often, since
+        its next fetch waits for the download, and slowing it further only
+        makes the crawl slower than the configured politeness. The average
+        response time of every host is kept for state(). '''
+    def __init__(self, min_delay, max_delay, metrics=None):
+        self.min_delay = min_delay
+        self.max_delay = max(min_delay, max_delay)
+        self.metrics = metrics
+        self.lock = Lock()
+        self.hosts = dict()
+
+    def _host(self, host):
+        # Caller holds self.lock.
+        rate = self.hosts.get(host)
+        if rate is None:
+            rate = self.hosts[host] = HostRate(self.min_delay)
+            if self.metrics is not None:
+                self.metrics.gauge(
+                    "crawler_host_delay_seconds", lambda: rate.delay,
+                    (("host", host),))
+        return rate
+
+    def observe(self, host, status, latency=None, wait=None):
+        ''' Account for a response of host and return the delay before its
+            next fetch. wait is a Retry-After in seconds. '''
+        with self.lock:
+            rate = self._host(host)
+            if latency is not None:
+                rate.latency = (
+                    latency if rate.latency is None
+                    else rate.latency + LATENCY_WEIGHT * (latency - rate.latency))
+            if is_backoff_status(status) or wait is not None:
+                rate.errors += 1
+                delay = max(rate.delay, BACKOFF_MIN_SECONDS) * BACKOFF_FACTOR
+                if wait is not None:
+                    delay = max(delay, wait)
+                if delay > rate.delay:
+                    rate.backoffs += 1
+                rate.delay = min(self.max_delay, delay)
+            else:
+                rate.delay = max(self.min_delay, rate.delay - RECOVERY_SECONDS)
+            return rate.delay
+
+    def delay(self, host):
+        with self.lock:
+            rate = self.hosts.get(host)
+            return rate.delay if rate is not None else self.min_delay
+
+    def state(self):
+        ''' host -> (delay, average response time, errors) of every host
+            seen so far. '''
+        with self.lock:
+            return {
+                host: (rate.delay, rate.latency, rate.errors)
+                for host, rate in self.hosts.items()}
+
+    def summary(self):
+        with self.lock:
+            slowed = sum(1 for rate in self.hosts.values() if rate.delay > self.min_delay)
+            backoffs = sum(rate.backoffs for rate in self.hosts.values())
+            errors = sum(rate.errors for rate in self.hosts.values())
+            return (
+                f"{len(self.hosts)} hosts, {errors} error responses, "
+                f"{backoffs} backoffs, {slowed} hosts above the minimum delay.")
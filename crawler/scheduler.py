@@ -0,0 +1,214 @@
+import heapq
+import time
+
+from itertools import count
+from threading import Condition
+from urllib.parse import urlparse
+
+
+class HostScheduler(object):
+    ''' Hands out urls so that no host is fetched more often than once per
+        delay seconds, without parking a worker on a busy host.
+
+        Every host has its own queue, a heap that gives its shallowest url
+        first and urls of the same depth in the order they came. Hosts that
+        have queued urls and no fetch in progress wait in a min-heap keyed
+        by the time they may be fetched next. Once that time has passed
+        they move to a ready heap that gives the host with the fewest pages
+        fetched so far first, then the one with the shallowest url, so
+        every ready host gets its turn before a prolific one (or a trap)
+        gets another. A host leaves both heaps while one of its urls is
+        being downloaded; busy maps it to that url, so only the end of
+        that download (not a late done() of an earlier url) frees it.
+
+        With memory_urls set, at most that many urls are kept in the host
+        queues; the rest go to spill (see crawler/spill.py) and are read
+        back, oldest first, once the queues drop to half of it.
+
+        on_change, when set, is called with the lock held every time a
+        url may have become available or the crawl may have finished, for
+        callers that wait on something other than get(). It must not
+        block. '''
+    def __init__(self, delay, lock=None, memory_urls=0, spill=None):
+        self.delay = delay
+        self.cond = Condition(lock)
+        self.queues = dict()
+        self.next_allowed = dict()
+        self.waiting = list()
+        self.ready = list()
+        self.scheduled = set()
+        self.busy = dict()
+        self.host_pages = dict()
+        self.depths = dict()
+        self.order = count()
+        self.memory_urls = memory_urls
+        self.spill = spill
+        self.queued = 0
+        self.in_flight = 0
+        self.loading = 0
+        self.on_change = None
+
+    def __len__(self):
+        return self.queued
+
+    def _notify(self, everyone=False):
+        # Caller holds self.cond.
+        if everyone:
+            self.cond.notify_all()
+        else:
+            self.cond.notify()
+        if self.on_change is not None:
+            self.on_change()
+
+    @staticmethod
+    def host_of(url):
+        return urlparse(url).netloc
+
+    def _schedule(self, host):
+        # Caller holds self.cond.
+        if self.queues.get(host) and host not in self.busy and host not in self.scheduled:
+            self.scheduled.add(host)
+            heapq.heappush(self.waiting, (self.next_allowed.get(host, 0), host))
+
+    def _enqueue(self, depth, url):
+        # Caller holds self.cond.
+        host = self.host_of(url)
+        queue = self.queues.get(host)
+        if queue is None:
+            queue = self.queues[host] = list()
+        heapq.heappush(queue, (depth, next(self.order), url))
+        if len(queue) == 1:
+            self._schedule(host)
+
+    def put(self, url, depth=0):
+        ''' Queue url, found depth links away from a seed or saved url. '''
+        with self.cond:
+            if (self.spill is not None and self.memory_urls
+                    and self.queued - len(self.spill) >= self.memory_urls):
+                self.spill.append(depth, url)
+            else:
+                self._enqueue(depth, url)
+            self.queued += 1
+            self._notify()
+
+    def _refill(self):
+        # Caller holds self.cond.
+        if (self.spill is not None and len(self.spill)
+                and self.queued - len(self.spill) <= self.memory_urls // 2):
+            for depth, url in self.spill.pop_segment():
+                self._enqueue(depth, url)
+
+    def _take(self):
+        # Caller holds self.cond. Returns (url, wait) like poll().
+        self._refill()
+        now = time.monotonic()
+        while self.waiting and self.waiting[0][0] <= now:
+            ready_at, host = heapq.heappop(self.waiting)
+            heapq.heappush(self.ready, (
+                self.host_pages.get(host, 0), self.queues[host][0][0],
+                next(self.order), host))
+        if self.ready:
+            host = heapq.heappop(self.ready)[-1]
+            queue = self.queues[host]
+            depth, _, url = heapq.heappop(queue)
+            if not queue:
+                del self.queues[host]
+            self.scheduled.discard(host)
+            self.busy[host] = url
+            self.host_pages[host] = self.host_pages.get(host, 0) + 1
+            self.depths[url] = depth
+            self.queued -= 1
+            self.in_flight += 1
+            return url, 0
+        if self.waiting:
+            return None, self.waiting[0][0] - now
+        if self.in_flight == 0 and not self.loading:
+            return None, None
+        # Only fetches in flight or saved urls still loading; nothing to do
+        # until one of them adds a url.
+        return None, -1
+
+    def get(self):
+        ''' Block until a url whose host is ready is available. Returns None
+            once nothing is queued, no fetch that could add urls is still in
+            flight and no loader is running. '''
+        with self.cond:
+            while True:
+                url, wait = self._take()
+                if url is not None or wait is None:
+                    return url
+                self.cond.wait(wait if wait > 0 else None)
+
+    def poll(self):
+        ''' Non-blocking get. Returns (url, 0) when a url is ready,
+            (None, seconds) when the next host becomes ready after that many
+            seconds, (None, -1) when only in-flight fetches or a loader can
+            add work and
+            (None, None) when the crawl is finished. '''
+        with self.cond:
+            return self._take()
+
+    def depth(self, url):
+        ''' Depth of a url handed out and not done yet, 0 for others. '''
+        with self.cond:
+            return self.depths.get(url, 0)
+
+    def add_host_pages(self, counts):
+        ''' Count pages fetched before, such as in the crawl being resumed,
+            in the host order. counts maps host to pages. '''
+        with self.cond:
+            for host, pages in counts.items():
+                self.host_pages[host] = self.host_pages.get(host, 0) + pages
+
+    def start_loading(self):
+        ''' A loader will put() more urls; the crawl is not finished before
+            the matching finish_loading(). '''
+        with self.cond:
+            self.loading += 1
+
+    def finish_loading(self):
+        with self.cond:
+            self.loading -= 1
+            self._notify(True)
+
+    def idle(self, loaders=0):
+        ''' True when no url is queued or in flight and at most loaders
+            loaders are running, those held by the caller. '''
+        with self.cond:
+            return self.queued == 0 and self.in_flight == 0 and self.loading <= loaders
+
+    def release(self, url, delay=None):
+        ''' The download of url finished: start the politeness timer of its
+            host, delay seconds (the default delay when None), and make its
+            remaining urls available again. '''
+        host = self.host_of(url)
+        with self.cond:
+            if self.busy.get(host) != url:
+                return
+            del self.busy[host]
+            self.next_allowed[host] = time.monotonic() + (
+                self.delay if delay is None else delay)
+            self._schedule(host)
+            self._notify()
+
+    def discard(self, url):
+        ''' A url handed out that will not be fetched after all. Its host is
+            available again without waiting for the politeness delay. '''
+        host = self.host_of(url)
+        with self.cond:
+            if self.busy.get(host) == url:
+                del self.busy[host]
+            self.host_pages[host] -= 1
+            self.depths.pop(url, None)
+            self.in_flight -= 1
+            self._schedule(host)
+            self._notify(True)
+
+    def done(self, url):
+        ''' All work for url is finished, including adding its links. '''
+        self.release(url)
+        with self.cond:
+            self.depths.pop(url, None)
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._notify(True)
@@ -0,0 +1,44 @@
+class SeenFilter(object):
+    ''' In-memory set of every url the frontier already holds, checked
+        before the store so repeated links are dropped without a disk
+        lookup or taking the frontier lock.
+
+        A url is kept as the first 8 bytes of its urlhash, as an int. Set
+        lookups and adds are atomic under the GIL, so readers take no lock.
+        Two threads that add the same new url at once both reach the store,
+        which still keeps only one of them. '''
+    def __init__(self):
+        self.keys = set()
+        # Pre-canonicalization hashes of duplicates already counted as saved.
+        self.aliases = set()
+        # Counters are only for reporting and are updated without a lock.
+        self.duplicates = 0
+        self.saved_fetches = 0
+
+    @staticmethod
+    def key(urlhash):
+        return int(urlhash[:16], 16)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, urlhash):
+        return self.key(urlhash) in self.keys
+
+    def add(self, urlhash):
+        self.keys.add(self.key(urlhash))
+
+    def seen(self, urlhash, raw_urlhash=None):
+        ''' True when urlhash was added before. raw_urlhash is the hash of
+            the url before canonicalization; a duplicate whose raw form has
+            a different hash would have been fetched again without
+            canonicalization and is counted once in saved_fetches. '''
+        if self.key(urlhash) not in self.keys:
+            return False
+        self.duplicates += 1
+        if raw_urlhash is not None and raw_urlhash != urlhash:
+            alias = self.key(raw_urlhash)
+            if alias not in self.aliases:
+                self.aliases.add(alias)
+                self.saved_fetches += 1
+        return True
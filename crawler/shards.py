@@ -0,0 +1,254 @@
+import multiprocessing
+import os
+import time
+
+from configparser import ConfigParser
+from hashlib import sha1
+from queue import Empty
+from threading import Lock, Thread
+from urllib.parse import urlparse
+
+from crawler import Crawler
+from crawler.frontier import Frontier, print_report
+from crawler.stats import CrawlStats
+from utils import get_logger, get_urlhash, canonicalize, logs
+from utils.config import Config
+
+# Seconds a shard waits for urls from the others before it reports whether
+# it is idle, and between the coordinator's checks for the end of the crawl.
+POLL_INTERVAL = 0.1
+
+
+def shard_of(url, shards):
+    ''' The shard owning the host of url. Uses sha1 rather than hash(),
+        which differs between processes. '''
+    netloc = urlparse(url).netloc
+    return int.from_bytes(sha1(netloc.encode("utf-8")).digest()[:8], "big") % shards
+
+
+def shard_parser(config_file, shard, shards):
+    ''' The config of one shard: its own save file, so its url store, stats
+        and dedupe log, and its own metrics port. The shard count is part of
+        the save name, so a save is only resumed with the same --shards. '''
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    properties = cparser["LOCAL PROPERTIES"]
+    properties["SAVE"] = f"{properties['SAVE']}.{shard}-of-{shards}"
+    port = int(properties.get("METRICS_PORT", "9100"))
+    if port:
+        properties["METRICS_PORT"] = str(port + shard)
+    return cparser
+
+
+class ShardRouter(object):
+    ''' Inboxes and counters shared by the shard processes of a crawl.
+
+        Every shard has an inbox for urls of its hosts found by the others.
+        A shard counts the urls it sends before putting them in an inbox
+        and the urls it receives after adding them to its frontier, and
+        reports itself idle when it has nothing queued or in flight. Once
+        all shards are idle and every url sent was received, no shard can
+        get more work and done is set. Each shard then puts its crawl stats
+        on results. '''
+    def __init__(self, shards, context):
+        self.shards = shards
+        self.inboxes = [context.Queue() for _ in range(shards)]
+        self.lock = context.Lock()
+        self.sent = context.RawArray("q", shards)
+        self.received = context.RawArray("q", shards)
+        self.idle = context.RawArray("b", shards)
+        self.done = context.Event()
+        self.results = context.Queue()
+
+    def send(self, source, target, message):
+        # message is a (url, depth) pair.
+        with self.lock:
+            self.sent[source] += 1
+        self.inboxes[target].put(message)
+
+    def mark_received(self, shard):
+        with self.lock:
+            self.received[shard] += 1
+            self.idle[shard] = 0
+
+    def set_idle(self, shard, idle):
+        with self.lock:
+            self.idle[shard] = int(idle)
+
+    def finished(self):
+        with self.lock:
+            return all(self.idle) and sum(self.sent) == sum(self.received)
+
+
+class ShardedFrontier(Frontier):
+    ''' Frontier of one shard. Urls of hosts owned by another shard are sent
+        to it instead of being stored, and a receiver thread adds the urls
+        the other shards send here. Workers keep waiting for urls until the
+        router says the whole crawl is done.
+
+        Sent urls are also appended to <SAVE>.outbox. A url still on its way
+        when the crawl stops would otherwise be lost, as the page linking
+        to it is already complete, so a resumed shard sends its outbox
+        again and the owners drop the urls they already have. '''
+    def __init__(self, config, restart, shard, router):
+        # Seeding in Frontier.__init__ already routes urls.
+        self.shard = shard
+        self.router = router
+        self.sent_urls = 0
+        self.received_urls = 0
+        self.outbox_path = f"{config.save_file}.outbox"
+        self.outbox_lock = Lock()
+        self.resender = None
+        if restart and os.path.exists(self.outbox_path):
+            os.remove(self.outbox_path)
+        elif os.path.exists(self.outbox_path):
+            # Holds the scheduler like the receiver, so the shard is not idle
+            # before the outbox is sent.
+            self.resender = Thread(
+                target=self._resend_outbox, name=f"shard-{shard}-resend", daemon=True)
+        self.outbox = open(self.outbox_path, "a")
+        super().__init__(config, restart)
+        self.scheduler.start_loading()
+        self.receiver = Thread(
+            target=self._receive, name=f"shard-{shard}-receiver", daemon=True)
+        self.receiver.start()
+        if self.resender is not None:
+            self.scheduler.start_loading()
+            self.resender.start()
+
+    def add_url(self, url, depth=0):
+        owner = shard_of(canonicalize(url), self.router.shards)
+        if owner == self.shard:
+            super().add_url(url, depth)
+            return
+        url = canonicalize(url)
+        urlhash = get_urlhash(url)
+        # Links to other shards go through the seen filter too, so each is
+        # only sent once by this shard.
+        if self.seen.seen(urlhash):
+            return
+        self.seen.add(urlhash)
+        self._send(owner, url, depth)
+
+    def _send(self, owner, url, depth):
+        with self.outbox_lock:
+            self.outbox.write(f"{url}\n")
+            self.outbox.flush()
+            self.sent_urls += 1
+        self.router.send(self.shard, owner, (url, depth))
+
+    def _resend_outbox(self):
+        resent = 0
+        try:
+            with open(self.outbox_path) as outbox:
+                for line in outbox:
+                    url = line.strip()
+                    if not url:
+                        continue
+                    urlhash = get_urlhash(url)
+                    if urlhash in self.seen:
+                        continue
+                    self.seen.add(urlhash)
+                    resent += 1
+                    self.router.send(
+                        self.shard, shard_of(url, self.router.shards), (url, 0))
+        finally:
+            self.scheduler.finish_loading()
+        self.logger.info(f"Shard {self.shard} sent {resent} saved urls again.")
+
+    def _receive(self):
+        inbox = self.router.inboxes[self.shard]
+        try:
+            while not self.router.done.is_set():
+                try:
+                    url, depth = inbox.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    # The hold taken in __init__ is the one allowed loader.
+                    self.router.set_idle(self.shard, self.scheduler.idle(1))
+                    continue
+                super().add_url(url, depth)
+                self.received_urls += 1
+                self.router.mark_received(self.shard)
+        finally:
+            self.scheduler.finish_loading()
+
+    def close(self):
+        self.receiver.join()
+        if self.resender is not None:
+            self.resender.join()
+        with self.outbox_lock:
+            self.outbox.close()
+        self.logger.info(
+            f"Shard {self.shard} sent {self.sent_urls} urls to other shards "
+            f"and received {self.received_urls}.")
+        super().close()
+
+
+def run_shard(config_file, shard, shards, restart, engine, cache_server, router):
+    ''' Entry point of a shard process. '''
+    config = Config(shard_parser(config_file, shard, shards))
+    if engine:
+        config.engine = engine
+    config.cache_server = cache_server
+    crawler = Crawler(
+        config, restart,
+        frontier_factory=lambda config, restart: ShardedFrontier(
+            config, restart, shard, router))
+    crawler.start()
+    router.results.put((shard, crawler.frontier.stats.snapshot()))
+    # Every url sent was received unless a shard died; do not wait at exit
+    # to flush urls nobody will read.
+    for inbox in router.inboxes:
+        inbox.cancel_join_thread()
+    crawler.frontier.close()
+    # A process ends without running atexit, which writes out queued logs.
+    logs.stop()
+
+
+def run_shards(config_file, shards, restart, engine, cache_server):
+    ''' Crawl with shards processes, each owning the hosts that shard_of
+        assigns to it, and print the report of all of them merged. Each
+        host belongs to exactly one shard, so its politeness delay is
+        still kept by one scheduler. Page dedupe is per shard: a page is
+        only compared with the pages of hosts in the same shard. '''
+    logger = get_logger("SHARDS")
+    # Spawn rather than fork, like the parse pool.
+    context = multiprocessing.get_context("spawn")
+    router = ShardRouter(shards, context)
+    processes = [
+        context.Process(
+            target=run_shard, name=f"shard-{shard}",
+            args=(config_file, shard, shards, restart, engine, cache_server, router))
+        for shard in range(shards)]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {shards} shards.")
+    while not router.done.is_set():
+        time.sleep(POLL_INTERVAL)
+        if router.finished():
+            router.done.set()
+        elif any(not process.is_alive() for process in processes):
+            # A shard died; let the others finish what they have queued.
+            logger.error("A shard exited before the crawl finished.")
+            router.done.set()
+    stats = CrawlStats(None, 0, 0, logger)
+    reported = set()
+    # Read the results before joining, a process does not exit while it
+    # still has queued data.
+    while len(reported) < shards:
+        try:
+            shard, state = router.results.get(timeout=POLL_INTERVAL)
+        except Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        reported.add(shard)
+        stats.merge(state)
+    for process in processes:
+        process.join()
+    if len(reported) < shards:
+        logger.error(
+            f"Shards {sorted(set(range(shards)) - reported)} did not report; "
+            f"their pages are missing from the totals.")
+    print_report(
+        stats.get_subdomain_count(), stats.get_tokens(), stats.get_longest_page())
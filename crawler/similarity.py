@@ -1,9 +1,16 @@
 import hashlib
+from functools import lru_cache
+from threading import Lock
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
-seen_digests = set()
-seen_fingerprints = []
 near_threshold = 3
+#number of distinct words whose hashes are kept between pages
+token_hash_cache_size = 1 << 17
 
 
 #creates a hash of the token counts
@@ -29,15 +36,32 @@ def string_to_bit_vector(s, size=64):
             n += 1
     return out[:size]
 
-#creates a fingerprint for a set of tokens using simhash
-def page_fingerprint(token_counts, size=64):
-    if not token_counts:
-        return 0
+#the same bits as string_to_bit_vector packed into an int (first bit is the
+#most significant), cached so common words are only hashed once per crawl
+@lru_cache(maxsize=token_hash_cache_size)
+def token_hash(s, size=64):
+    raw_digest = hashlib.sha256(s.encode("utf-8")).digest()
+    return int.from_bytes(raw_digest, "big") >> (len(raw_digest) * 8 - size)
+
+#sums +weight / -weight per bit over a token x 64 bit matrix in one numpy step
+#returns one row of 64 sums per page, pages are given as start offsets
+def _accumulate_64(words, weights, starts):
+    hashes = np.fromiter(
+        (token_hash(word) for word in words), dtype=">u8", count=len(words))
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    signs = bits.astype(np.int64) * 2 - 1
+    signed = signs * np.asarray(weights)[:, None]
+    return np.add.reduceat(signed, starts, axis=0)
+
+def _pack_64(accum):
+    return int.from_bytes(np.packbits(accum > 0).tobytes(), "big")
+
+def _page_fingerprint_py(token_counts, size):
     accum = [0] * size
     for word, weight in token_counts.items():
-        vec = string_to_bit_vector(word, size)
+        bits = token_hash(word, size)
         for idx in range(size):
-            accum[idx] += weight if vec[idx] else -weight
+            accum[idx] += weight if (bits >> (size - 1 - idx)) & 1 else -weight
     result = 0
     pos = 0
     while pos < size:
@@ -46,6 +70,32 @@ def page_fingerprint(token_counts, size=64):
         pos += 1
     return result
 
+#creates a fingerprint for a set of tokens using simhash
+def page_fingerprint(token_counts, size=64):
+    if not token_counts:
+        return 0
+    if np is None or size != 64:
+        return _page_fingerprint_py(token_counts, size)
+    accum = _accumulate_64(list(token_counts), list(token_counts.values()), [0])
+    return _pack_64(accum[0])
+
+#fingerprints many pages with a single matrix, same results as page_fingerprint
+def page_fingerprints(pages, size=64):
+    if np is None or size != 64:
+        return [page_fingerprint(token_counts, size) for token_counts in pages]
+    words = []
+    weights = []
+    starts = []
+    for token_counts in pages:
+        if token_counts:
+            starts.append(len(words))
+            words.extend(token_counts)
+            weights.extend(token_counts.values())
+    if not words:
+        return [0] * len(pages)
+    rows = iter(_accumulate_64(words, weights, starts))
+    return [_pack_64(next(rows)) if token_counts else 0 for token_counts in pages]
+
 #gets the similarity between two fingerprints
 def count_bit_differences(fp_a, fp_b, size=64):
     diff = fp_a ^ fp_b
@@ -53,28 +103,86 @@ def count_bit_differences(fp_a, fp_b, size=64):
     diff &= mask
     return bin(diff).count("1")
 
-#self explanatory, checks if the page is a duplicate
-def check_duplicate(token_counts):
-    global seen_digests, seen_fingerprints
+#index of fingerprints for near duplicate lookups (Manku et al. style)
+#the bits are split into threshold + 1 blocks and each block gets a table
+#two fingerprints that differ in at most threshold bits must agree exactly
+#on at least one block, so probing one bucket per table finds every match
+class SimhashIndex(object):
+    def __init__(self, threshold=near_threshold, size=64):
+        self.threshold = threshold
+        self.size = size
+        self.fingerprints = []
+        blocks = threshold + 1
+        self.blocks = []
+        start = 0
+        for idx in range(blocks):
+            width = size // blocks + (1 if idx < size % blocks else 0)
+            self.blocks.append((size - start - width, (1 << width) - 1))
+            start += width
+        self.tables = [dict() for _ in self.blocks]
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def add(self, fingerprint):
+        self.fingerprints.append(fingerprint)
+        for table, (shift, mask) in zip(self.tables, self.blocks):
+            key = (fingerprint >> shift) & mask
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = [fingerprint]
+            else:
+                bucket.append(fingerprint)
+
+    def extend(self, fingerprints):
+        for fingerprint in fingerprints:
+            self.add(fingerprint)
+
+    def has_near(self, fingerprint):
+        for table, (shift, mask) in zip(self.tables, self.blocks):
+            for stored in table.get((fingerprint >> shift) & mask, ()):
+                if count_bit_differences(fingerprint, stored, self.size) <= self.threshold:
+                    return True
+        return False
+
+
+seen_digests = set()
+seen_index = SimhashIndex(near_threshold)
+#guards seen_digests and seen_index so check and insert happen together
+state_lock = Lock()
+
+
+#checks if the page is a duplicate and remembers it if it is not
+#returns None for a duplicate, otherwise the (digest, fingerprint) it stored
+#the hashing happens outside the lock, only the lookups and inserts are inside
+#digest and fingerprint can be passed in when they were computed elsewhere
+def check_and_insert(token_counts, digest=None, fingerprint=None):
     if not token_counts:
-        return True
-    digest = compute_content_digest(token_counts)
+        return None
+    if digest is None:
+        digest = compute_content_digest(token_counts)
     if digest in seen_digests:
-        return True
-    fingerprint = page_fingerprint(token_counts)
-    for stored in seen_fingerprints:
-        if count_bit_differences(fingerprint, stored) <= near_threshold:
-            return True
-    seen_digests.add(digest)
-    seen_fingerprints.append(fingerprint)
-    return False
+        return None
+    if fingerprint is None:
+        fingerprint = page_fingerprint(token_counts)
+    with state_lock:
+        if digest in seen_digests or seen_index.has_near(fingerprint):
+            return None
+        seen_digests.add(digest)
+        seen_index.add(fingerprint)
+    return digest, fingerprint
+
+#self explanatory, checks if the page is a duplicate
+def check_duplicate(token_counts):
+    return check_and_insert(token_counts) is None
 
 #restore the cache so we remember the pages we have seen
 def restore_state(digest_list, fingerprint_list):
-    global seen_digests, seen_fingerprints
-    seen_digests |= set(digest_list or [])
-    seen_fingerprints.extend(fingerprint_list or [])
+    with state_lock:
+        seen_digests.update(digest_list or [])
+        seen_index.extend(fingerprint_list or [])
 
 #get the state of the cache so we can save it
 def get_state_for_save():
-    return (list(seen_digests), list(seen_fingerprints))
+    with state_lock:
+        return (list(seen_digests), list(seen_index.fingerprints))
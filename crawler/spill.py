@@ -0,0 +1,57 @@
+import os
+import pickle
+import shutil
+
+from collections import deque
+
+
+class SpillSegments(object):
+    ''' Queued urls that did not fit in memory, as (depth, url) entries.
+
+        Entries are collected in a buffer of segment_size entries that is
+        pickled to its own file in directory when full. pop_segment returns
+        the oldest segment, from disk or the buffer, and deletes its file.
+        Nothing here survives a restart: every spilled url is also pending
+        in the url store and is queued again from there when resuming. '''
+    def __init__(self, directory, segment_size=10000):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segments = deque()
+        self.buffer = list()
+        self.next_segment = 0
+        self.count = 0
+        self.remove()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, depth, url):
+        self.buffer.append((depth, url))
+        self.count += 1
+        if len(self.buffer) >= self.segment_size:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"segment-{self.next_segment:08d}")
+        self.next_segment += 1
+        with open(path, "wb") as segment:
+            pickle.dump(self.buffer, segment, protocol=pickle.HIGHEST_PROTOCOL)
+        self.segments.append(path)
+        self.buffer = list()
+
+    def pop_segment(self):
+        ''' The oldest spilled entries, at most segment_size of them. '''
+        if self.segments:
+            path = self.segments.popleft()
+            with open(path, "rb") as segment:
+                entries = pickle.load(segment)
+            os.remove(path)
+        else:
+            entries, self.buffer = self.buffer, list()
+        self.count -= len(entries)
+        return entries
+
+    def remove(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
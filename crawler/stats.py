@@ -0,0 +1,143 @@
+import os
+import pickle
+
+from threading import Event, Lock, Thread
+
+from crawler.tokens import TokenCounts, TOP_WORDS, SKETCH_WIDTH, from_counter, rank
+
+
+class CrawlStats(object):
+    ''' Crawl aggregates (subdomain counts, tokens, longest page) kept in
+        memory and written to disk by a checkpoint thread every
+        every_pages pages or every_seconds seconds. Word counts are kept in
+        a TokenCounts of top_words words and a sketch of sketch_width, so
+        their size does not grow with the vocabulary. '''
+    def __init__(self, path, every_pages, every_seconds, logger,
+                 top_words=TOP_WORDS, sketch_width=SKETCH_WIDTH):
+        self.path = path
+        self.every_pages = every_pages
+        self.every_seconds = every_seconds
+        self.logger = logger
+        self.lock = Lock()
+        self.top_words = top_words
+        self.sketch_width = sketch_width
+        self.subdomain_counts = dict()
+        self.tokens = TokenCounts(top_words, sketch_width)
+        self.longest_page = (0, "")
+        self.pages_since_checkpoint = 0
+        self.wake = Event()
+        self.stopped = Event()
+        self.thread = None
+
+    def load(self):
+        ''' Restore the last checkpoint. Returns False if there is none. '''
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as snapshot:
+            self.restore(pickle.load(snapshot))
+        return True
+
+    def _token_counts(self, tokens):
+        # Older checkpoints and shelve saves hold a Counter of every word.
+        if isinstance(tokens, TokenCounts):
+            return tokens.copy()
+        return from_counter(tokens, self.top_words, self.sketch_width)
+
+    def restore(self, state):
+        subdomain_counts, tokens, longest_page = state
+        tokens = self._token_counts(tokens)
+        with self.lock:
+            self.subdomain_counts = dict(subdomain_counts)
+            self.tokens = tokens
+            self.longest_page = tuple(longest_page)
+
+    def merge(self, state):
+        ''' Add the aggregates of another crawl, as returned by snapshot(),
+            such as those of another shard. '''
+        subdomain_counts, tokens, longest_page = state
+        tokens = self._token_counts(tokens)
+        with self.lock:
+            for domain, count in subdomain_counts.items():
+                self.subdomain_counts[domain] = self.subdomain_counts.get(domain, 0) + count
+            if not self.tokens.total:
+                # Takes the sketch size of the first crawl merged.
+                self.tokens = tokens
+            else:
+                self.tokens.merge(tokens)
+            if longest_page[0] > self.longest_page[0]:
+                self.longest_page = tuple(longest_page)
+
+    def start(self):
+        self.thread = Thread(
+            target=self._run, name="stats-checkpoint", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.wake.wait(self.every_seconds)
+            self.wake.clear()
+            self.checkpoint()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.checkpoint()
+
+    def snapshot(self):
+        with self.lock:
+            self.pages_since_checkpoint = 0
+            return (
+                dict(self.subdomain_counts), self.tokens.copy(),
+                self.longest_page)
+
+    def checkpoint(self):
+        # Write to a temporary file and rename it over the old checkpoint,
+        # so a crash leaves either the previous or the new snapshot.
+        state = self.snapshot()
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "wb") as tmp:
+                pickle.dump(state, tmp, protocol=pickle.HIGHEST_PROTOCOL)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.error(f"Could not checkpoint stats to {self.path}: {e}")
+
+    def add_subdomain_count(self, domain):
+        with self.lock:
+            self.subdomain_counts[domain] = self.subdomain_counts.get(domain, 0) + 1
+            self.pages_since_checkpoint += 1
+            due = self.pages_since_checkpoint >= self.every_pages
+        if due:
+            self.wake.set()
+
+    def add_tokens(self, tokens):
+        with self.lock:
+            self.tokens.update(tokens)
+
+    def update_longest_page(self, url, word_count):
+        with self.lock:
+            if word_count > self.longest_page[0]:
+                self.longest_page = (word_count, url)
+
+    def get_subdomain_count(self):
+        with self.lock:
+            return dict(self.subdomain_counts)
+
+    def get_tokens(self):
+        with self.lock:
+            return self.tokens.copy()
+
+    def top_tokens(self, n=50):
+        ''' The n most common words and their counts, ranked outside the
+            lock so workers adding tokens are not held up. '''
+        with self.lock:
+            items = self.tokens.items()
+        return rank(items, n)
+
+    def get_longest_page(self):
+        with self.lock:
+            return self.longest_page
@@ -0,0 +1,252 @@
+import os
+import sqlite3
+import time
+
+from threading import Event, Lock, Thread
+
+from utils.metrics import get_metrics
+
+TBD = "tbd"
+
+
+class ShelveStore(object):
+    ''' Original layout: every url lives in one dict stored under save[TBD].
+        Each write re-pickles the whole dict, kept for compatibility. '''
+    def __init__(self, save):
+        self.save = save
+        if TBD not in self.save:
+            self.save[TBD] = dict()
+
+    def __contains__(self, urlhash):
+        return urlhash in self.save[TBD]
+
+    def __len__(self):
+        return len(self.save[TBD])
+
+    def add(self, urlhash, url):
+        tbd = self.save[TBD]
+        if urlhash in tbd:
+            return False
+        tbd[urlhash] = (url, False)
+        self.save[TBD] = tbd
+        self.save.sync()
+        return True
+
+    def complete(self, urlhash, url):
+        tbd = self.save[TBD]
+        tbd[urlhash] = (url, True)
+        self.save[TBD] = tbd
+        self.save.sync()
+
+    def reopen(self, urlhash):
+        tbd = self.save[TBD]
+        if urlhash not in tbd or not tbd[urlhash][1]:
+            return False
+        tbd[urlhash] = (tbd[urlhash][0], False)
+        self.save[TBD] = tbd
+        self.save.sync()
+        return True
+
+    def items(self):
+        return list(self.save[TBD].values())
+
+    def pending(self, batch_size):
+        ''' Batches of (urlhash, url) for the urls not completed yet. The
+            dict is already in memory, so this only snapshots it. '''
+        rows = [
+            (urlhash, url) for urlhash, (url, completed) in self.save[TBD].items()
+            if not completed]
+        return (
+            rows[idx:idx + batch_size] for idx in range(0, len(rows), batch_size))
+
+    def flush(self):
+        self.save.sync()
+
+    def close(self):
+        self.flush()
+
+
+class SqliteDatabase(object):
+    ''' A WAL-mode sqlite file whose writes are grouped into one
+        transaction that is committed every batch_size writes or
+        batch_seconds, whichever comes first. A background thread commits
+        a batch that is due when no further write comes to do it. '''
+    def __init__(self, path, batch_size=500, batch_seconds=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.lock = Lock()
+        self.metrics = get_metrics()
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.pending_writes = 0
+        self.batch_started = None
+        # Set while a batch is open, for the commit thread.
+        self.batch_open = Event()
+        self.stopped = Event()
+        self.committer = Thread(
+            target=self._run, name="store-commit", daemon=True)
+        self.committer.start()
+
+    @staticmethod
+    def remove(path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def _write(self, query, params):
+        # Caller holds self.lock.
+        if self.batch_started is None:
+            self.conn.execute("BEGIN")
+            self.batch_started = time.monotonic()
+            self.batch_open.set()
+        cursor = self.conn.execute(query, params)
+        self.pending_writes += 1
+        if (self.pending_writes >= self.batch_size
+                or time.monotonic() - self.batch_started >= self.batch_seconds):
+            self._commit()
+        return cursor
+
+    def _commit(self):
+        # Caller holds self.lock.
+        if self.batch_started is not None:
+            start = self.metrics.clock()
+            self.conn.execute("COMMIT")
+            self.metrics.stage("store_commit", start)
+        self.pending_writes = 0
+        self.batch_started = None
+
+    def _run(self):
+        # Sleeps until a batch is opened, then until it is due.
+        while True:
+            self.batch_open.wait()
+            if self.stopped.is_set():
+                return
+            with self.lock:
+                wait = None
+                if self.batch_started is not None:
+                    wait = self.batch_started + self.batch_seconds - time.monotonic()
+                    if wait <= 0:
+                        self._commit()
+                        wait = None
+                if wait is None:
+                    self.batch_open.clear()
+            if wait is not None:
+                self.stopped.wait(wait)
+
+    def flush(self):
+        with self.lock:
+            self._commit()
+
+    def close(self):
+        self.stopped.set()
+        self.batch_open.set()
+        self.committer.join()
+        with self.lock:
+            self._commit()
+            self.conn.close()
+
+
+class SqliteStore(SqliteDatabase):
+    ''' One row per url keyed by urlhash, see SqliteDatabase. '''
+    def __init__(self, path, batch_size=500, batch_seconds=1.0):
+        super().__init__(path, batch_size, batch_seconds)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "completed INTEGER NOT NULL DEFAULT 0)")
+        # Only pending urls are in this index, so resuming reads just them.
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS urls_pending ON urls (completed) "
+            "WHERE completed = 0")
+
+    def __contains__(self, urlhash):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM urls WHERE urlhash = ?",
+                (urlhash,)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def add(self, urlhash, url):
+        with self.lock:
+            cursor = self._write(
+                "INSERT OR IGNORE INTO urls (urlhash, url, completed) "
+                "VALUES (?, ?, 0)", (urlhash, url))
+            return cursor.rowcount == 1
+
+    def complete(self, urlhash, url):
+        with self.lock:
+            self._write(
+                "INSERT OR REPLACE INTO urls (urlhash, url, completed) "
+                "VALUES (?, ?, 1)", (urlhash, url))
+
+    def reopen(self, urlhash):
+        ''' Mark a completed url pending again, to be fetched again (see
+            crawler/pages.py). False when it is not completed. '''
+        with self.lock:
+            cursor = self._write(
+                "UPDATE urls SET completed = 0 WHERE urlhash = ? AND completed = 1",
+                (urlhash,))
+            return cursor.rowcount == 1
+
+    def items(self):
+        with self.lock:
+            return [
+                (url, bool(completed)) for url, completed in
+                self.conn.execute("SELECT url, completed FROM urls")]
+
+    def pending(self, batch_size):
+        ''' Batches of (urlhash, url) for the urls that are not completed,
+            in the order they were added. Only urls stored before this call
+            are returned: later ones are queued by whoever adds them, and
+            completing a url rewrites its row with a new rowid. '''
+        with self.lock:
+            last_rowid = self.conn.execute(
+                "SELECT MAX(rowid) FROM urls").fetchone()[0] or 0
+        return self._pending_batches(last_rowid, batch_size)
+
+    def _pending_batches(self, last_rowid, batch_size):
+        rowid = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT rowid, urlhash, url FROM urls "
+                    "WHERE completed = 0 AND rowid > ? AND rowid <= ? "
+                    "ORDER BY rowid LIMIT ?",
+                    (rowid, last_rowid, batch_size)).fetchall()
+            if not rows:
+                return
+            rowid = rows[-1][0]
+            yield [(urlhash, url) for _, urlhash, url in rows]
+
+    def import_items(self, items):
+        ''' Bulk load (urlhash, url, completed) rows, e.g. from a shelve save. '''
+        with self.lock:
+            self._commit()
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO urls (urlhash, url, completed) "
+                "VALUES (?, ?, ?)",
+                ((urlhash, url, int(completed))
+                 for urlhash, (url, completed) in items))
+            self.conn.execute("COMMIT")
+
+
+def open_store(config, save, restart):
+    if config.store == "shelve":
+        return ShelveStore(save)
+    if config.store != "sqlite":
+        raise ValueError(f"Unknown frontier store {config.store}.")
+    if restart:
+        SqliteStore.remove(config.store_file)
+    store = SqliteStore(
+        config.store_file, config.store_batch_size, config.store_batch_seconds)
+    if not restart and not len(store) and save.get(TBD):
+        # First run on top of a shelve save: carry its urls over once.
+        store.import_items(save[TBD].items())
+    return store
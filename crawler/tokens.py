@@ -0,0 +1,213 @@
+import heapq
+
+from array import array
+
+from crawler.similarity import token_hash
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Words whose counts are tracked exactly enough to rank them, and the size
+# of the count-min sketch that bounds the counts of the others.
+TOP_WORDS = 10000
+SKETCH_WIDTH = 1 << 17
+SKETCH_DEPTH = 4
+
+
+class TokenCounts(object):
+    ''' Word counts of the whole crawl in a fixed amount of memory.
+
+        A count-min sketch of SKETCH_DEPTH rows of width counters holds an
+        upper bound for the count of every word ever added. Next to it a
+        Space-Saving table keeps the top_words most frequent words with a
+        count and the most that count may be over the true one (error).
+        A word that is not in a full table replaces the word with the
+        smallest count; it starts at that count plus its own, or at its
+        sketch estimate when that is lower. Any word counted more often
+        than the smallest count in the table is in the table, so the top
+        of most_common() is exact whenever the gaps between its counts are
+        larger than the errors, see error_bound.
+
+        Words are hashed with similarity.token_hash, which is the same in
+        every process, so counts of shards or of a saved crawl merge. '''
+    def __init__(self, top_words=TOP_WORDS, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.top_words = top_words
+        self.width = width
+        self.depth = depth
+        # One row after the other; a numpy array when numpy is installed.
+        self.sketch = _zeros(width * depth)
+        # word -> [count, error]
+        self.counts = dict()
+        # (count, word) for every word in counts; a count may be stale, but
+        # is never larger than the current one, see _evict.
+        self.heap = list()
+        self.total = 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _cells(self, word):
+        # The index of the counter for word in each row of the sketch.
+        bits = token_hash(word)
+        first, step = bits >> 32, (bits & 0xffffffff) | 1
+        width = self.width
+        return [row * width + (first + row * step) % width for row in range(self.depth)]
+
+    def estimate(self, word):
+        ''' An upper bound for the count of word. '''
+        entry = self.counts.get(word)
+        if entry is not None:
+            return entry[0]
+        return self._estimate_sketch(word)
+
+    def _estimate_sketch(self, word):
+        return int(min(self.sketch[cell] for cell in self._cells(word)))
+
+    def _add_sketch(self, words, counts):
+        # Adds counts to the sketch and returns the new estimate of each word.
+        if np is None:
+            sketch = self.sketch
+            estimates = list()
+            for word, count in zip(words, counts):
+                cells = self._cells(word)
+                for cell in cells:
+                    sketch[cell] += count
+                estimates.append(min(sketch[cell] for cell in cells))
+            return estimates
+        # All words of a page in one step, one row of cells per sketch row.
+        bits = np.fromiter(
+            map(token_hash, words), dtype=np.uint64, count=len(words))
+        first = bits >> np.uint64(32)
+        step = (bits & np.uint64(0xffffffff)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        cells = ((first + rows * step) % np.uint64(self.width)
+                 + rows * np.uint64(self.width)).astype(np.intp)
+        np.add.at(
+            self.sketch, cells.ravel(),
+            np.tile(np.asarray(counts, dtype=np.int64), self.depth))
+        return self.sketch[cells].min(axis=0).tolist()
+
+    def update(self, tokens):
+        ''' Add a word -> count mapping, such as the tokens of a page. '''
+        if not tokens:
+            return
+        words = list(tokens)
+        counts = list(tokens.values())
+        estimates = self._add_sketch(words, counts)
+        self.total += sum(counts)
+        for word, count, estimate in zip(words, counts, estimates):
+            entry = self.counts.get(word)
+            if entry is not None:
+                entry[0] += count
+            elif len(self.counts) < self.top_words:
+                self.counts[word] = [count, 0]
+                heapq.heappush(self.heap, (count, word))
+            else:
+                # Never below the word it replaces, so no word left out of
+                # the table has a higher count than the ones in it.
+                floor = self._evict()
+                start = max(floor, min(floor + count, estimate))
+                self.counts[word] = [start, start - count]
+                heapq.heappush(self.heap, (start, word))
+
+    def _evict(self):
+        # Removes the word with the smallest count and returns its count.
+        # Counts only grow, so a heap entry with an old count is pushed
+        # again with the current one until the smallest is up to date.
+        while True:
+            count, word = self.heap[0]
+            current = self.counts[word][0]
+            if current == count:
+                heapq.heappop(self.heap)
+                del self.counts[word]
+                return count
+            heapq.heapreplace(self.heap, (current, word))
+
+    @property
+    def error_bound(self):
+        ''' The most any count in most_common() can be over its true count,
+            and the highest count a word missing from it can have. '''
+        if len(self.counts) < self.top_words:
+            return 0
+        return min(count for count, error in self.counts.values())
+
+    def items(self):
+        ''' (word, count, error) of the tracked words, in no order. '''
+        return [(word, count, error) for word, (count, error) in self.counts.items()]
+
+    def most_common(self, n=None):
+        ''' The n (all tracked when None) most frequent words with their
+            counts, like Counter.most_common. '''
+        return rank(self.items(), n)
+
+    def copy(self):
+        other = TokenCounts(self.top_words, self.width, self.depth)
+        other.sketch = self.sketch.copy() if np is not None else array("q", self.sketch)
+        other.counts = {word: list(entry) for word, entry in self.counts.items()}
+        other.heap = list(self.heap)
+        other.total = self.total
+        return other
+
+    def merge(self, other):
+        ''' Add the counts of another TokenCounts with the same sketch size,
+            such as those of another shard. '''
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError(
+                f"Cannot merge a {other.depth}x{other.width} sketch into a "
+                f"{self.depth}x{self.width} one.")
+        if np is not None:
+            self.sketch += np.asarray(other.sketch, dtype=np.int64)
+        else:
+            for cell, count in enumerate(other.sketch):
+                if count:
+                    self.sketch[cell] += int(count)
+        self.total += other.total
+        # A word missing from a full table may have up to its smallest
+        # count there, and at least none. A word missing from both may have the
+        # two smallest counts together, so no count is lowered below that.
+        floors = [table.error_bound for table in (self, other)]
+        merged = list()
+        for word in self.counts.keys() | other.counts.keys():
+            count = error = 0
+            for table, floor in zip((self.counts, other.counts), floors):
+                entry = table.get(word)
+                if entry is None:
+                    count += floor
+                    error += floor
+                else:
+                    count += entry[0]
+                    error += entry[1]
+            capped = max(sum(floors), min(count, self._estimate_sketch(word)))
+            merged.append((word, capped, capped - (count - error)))
+        merged = rank(merged, self.top_words, errors=True)
+        self.counts = {word: [count, error] for word, count, error in merged}
+        self.heap = [(count, word) for word, count, error in merged]
+        heapq.heapify(self.heap)
+
+
+def _zeros(size):
+    if np is not None:
+        return np.zeros(size, dtype=np.int64)
+    return array("q", bytes(8 * size))
+
+
+def rank(items, n=None, errors=False):
+    ''' The n items of (word, count, error) with the highest counts, as
+        (word, count) pairs or, with errors, as they are. '''
+    if n is None:
+        top = sorted(items, key=lambda item: (-item[1], item[0]))
+    else:
+        top = heapq.nsmallest(n, items, key=lambda item: (-item[1], item[0]))
+    if errors:
+        return top
+    return [(word, count) for word, count, error in top]
+
+
+def from_counter(counter, top_words=TOP_WORDS, width=SKETCH_WIDTH):
+    ''' TokenCounts holding the counts of a Counter, such as the token
+        counts saved by older crawls. '''
+    counts = TokenCounts(top_words, width)
+    counts.update(counter)
+    return counts
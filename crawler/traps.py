@@ -0,0 +1,220 @@
+import math
+import os
+import pickle
+import re
+
+from threading import Lock
+from urllib.parse import urlsplit
+
+DIGITS_RE = re.compile(r"\d+")
+# A url deeper than this, or repeating a path segment this often, is a trap
+# whatever its host looks like (calendar and relative link loops).
+MAX_PATH_DEPTH = 12
+MAX_SEGMENT_REPEATS = 3
+# A url deeper than DEPTH_SIGMAS standard deviations over the mean depth of
+# its host is a trap, once the host has DEPTH_MIN_SAMPLES urls and the url
+# is deeper than DEPTH_FLOOR. Only on hosts that already waste the crawl:
+# at least MIN_PATTERN_PAGES of their pages fetched and HOST_WASTED_RATIO
+# of them duplicates. Deep pages of a healthy host are fetched.
+DEPTH_MIN_SAMPLES = 100
+DEPTH_SIGMAS = 4
+DEPTH_FLOOR = 6
+HOST_WASTED_RATIO = 0.5
+# A path whose queries use this many different sets of parameter names
+# takes no new set (faceted searches and filters combined without end).
+# Different values of the same parameters, such as ?id=1 ... ?id=1000,
+# are left to the pattern rule below.
+MAX_PARAM_SETS = 30
+# A pattern is a trap once MIN_PATTERN_PAGES of its pages were fetched and
+# WASTED_RATIO of them were duplicates or near duplicates of other pages.
+# Pages with little text and error responses do not count as wasted: a
+# directory of short pages or a host that fails for a while is no trap.
+MIN_PATTERN_PAGES = 20
+WASTED_RATIO = 0.8
+
+
+def url_pattern(url):
+    ''' The shape of a url: host, path with every number replaced by <n>,
+        and the sorted query parameter names. Pages of a calendar or of a
+        generated listing share one pattern. '''
+    return _pattern(urlsplit(url))
+
+
+def _pattern(parsed):
+    params = tuple(sorted({
+        param.partition("=")[0] for param in parsed.query.split("&") if param}))
+    return parsed.netloc.lower(), DIGITS_RE.sub("<n>", parsed.path.rstrip("/")), params
+
+
+class PatternStats(object):
+    __slots__ = ("pages", "wasted")
+
+    def __init__(self):
+        self.pages = 0
+        self.wasted = 0
+
+    def add(self, wasted):
+        self.pages += 1
+        self.wasted += bool(wasted)
+
+    def wasteful(self, ratio):
+        return self.pages >= MIN_PATTERN_PAGES and self.wasted >= ratio * self.pages
+
+
+class HostDepths(object):
+    ''' Running mean and variance of the path depth of a host's urls. '''
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, depth):
+        self.count += 1
+        delta = depth - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (depth - self.mean)
+
+    def limit(self):
+        if self.count < DEPTH_MIN_SAMPLES:
+            return None
+        return max(DEPTH_FLOOR, self.mean + DEPTH_SIGMAS * math.sqrt(self.m2 / self.count))
+
+
+class TrapDetector(object):
+    ''' Learns crawler traps from the crawl itself, next to the static
+        rules in scraper.py.
+
+        allow() is asked for every new url before it is stored. It rejects
+        urls that are too deep, at all or for a host whose pages are mostly
+        duplicates, that repeat a path segment, that add yet another set
+        of query parameter names to a path that already has MAX_PARAM_SETS
+        of them, or whose pattern (see url_pattern) is a known trap.
+        record_page() is told about every page fetched without an error; a
+        pattern whose pages are mostly duplicates becomes a trap, and its
+        queued urls are dropped when the frontier hands them out.
+
+        Trap patterns and closed paths are saved to path on close and
+        loaded on resume. '''
+    def __init__(self, path, restart, logger=None):
+        self.path = path
+        self.logger = logger
+        self.lock = Lock()
+        self.patterns = dict()
+        # host -> PatternStats of all its fetched pages
+        self.host_pages = dict()
+        self.hosts = dict()
+        self.queries = dict()
+        self.query_traps = set()
+        self.traps = set()
+        self.rejected = dict()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        elif os.path.exists(path):
+            with open(path, "rb") as saved:
+                self.traps, closed = pickle.load(saved)
+            # Closed paths keep the parameter sets they allowed.
+            self.query_traps = set(closed)
+            self.queries.update(closed)
+
+    def _reject(self, reason):
+        # Caller holds self.lock.
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return False
+
+    def allow(self, url):
+        ''' False when url looks like part of a trap. Counts url in the
+            statistics of its host and path otherwise. '''
+        parsed = urlsplit(url)
+        host = parsed.netloc.lower()
+        path = parsed.path.rstrip("/")
+        segments = [segment for segment in path.split("/") if segment]
+        pattern = _pattern(parsed)
+        with self.lock:
+            if pattern in self.traps:
+                return self._reject("trap pattern")
+            if len(segments) > MAX_PATH_DEPTH:
+                return self._reject("path depth")
+            if segments and max(map(segments.count, set(segments))) >= MAX_SEGMENT_REPEATS:
+                return self._reject("repeated segment")
+            depths = self.hosts.get(host)
+            if depths is None:
+                depths = self.hosts[host] = HostDepths()
+            limit = depths.limit()
+            if limit is not None and len(segments) > limit:
+                pages = self.host_pages.get(host)
+                if pages is not None and pages.wasteful(HOST_WASTED_RATIO):
+                    return self._reject("host depth")
+            if parsed.query:
+                key = (host, path)
+                params = pattern[2]
+                param_sets = self.queries.get(key)
+                if param_sets is None:
+                    param_sets = self.queries[key] = set()
+                if params not in param_sets:
+                    if key in self.query_traps:
+                        return self._reject("parameter sets")
+                    param_sets.add(params)
+                    if len(param_sets) > MAX_PARAM_SETS:
+                        # Queries with the parameter sets seen so far are
+                        # still allowed.
+                        param_sets.discard(params)
+                        self.query_traps.add(key)
+                        self._log(
+                            f"Too many sets of query parameters on {host}{path}, "
+                            f"skipping new ones.")
+                        return self._reject("parameter sets")
+            depths.add(len(segments))
+        return True
+
+    def is_trap(self, url):
+        ''' True when the pattern of url became a trap after it was queued. '''
+        pattern = url_pattern(url)
+        with self.lock:
+            if pattern in self.traps:
+                self._reject("queued in trap pattern")
+                return True
+        return False
+
+    def record_page(self, url, wasted):
+        ''' Count a fetched page of url; wasted when it was a duplicate or
+            near duplicate of a page fetched before. '''
+        pattern = url_pattern(url)
+        with self.lock:
+            host = self.host_pages.get(pattern[0])
+            if host is None:
+                host = self.host_pages[pattern[0]] = PatternStats()
+            host.add(wasted)
+            stats = self.patterns.get(pattern)
+            if stats is None:
+                stats = self.patterns[pattern] = PatternStats()
+            stats.add(wasted)
+            if pattern not in self.traps and stats.wasteful(WASTED_RATIO):
+                self.traps.add(pattern)
+                host, path, params = pattern
+                self._log(
+                    f"{host}{path} with parameters {list(params)} is a trap: "
+                    f"{stats.wasted} of {stats.pages} pages were wasted.")
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.warning(message)
+
+    def summary(self):
+        with self.lock:
+            reasons = ", ".join(
+                f"{count} {reason}" for reason, count in sorted(self.rejected.items()))
+            return (
+                f"{len(self.traps)} trap patterns, {len(self.query_traps)} paths "
+                f"closed to new query parameters; skipped urls: {reasons or 'none'}.")
+
+    def close(self):
+        with self.lock:
+            state = (
+                self.traps,
+                {key: self.queries.get(key, set()) for key in self.query_traps})
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as saved:
+            pickle.dump(state, saved, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
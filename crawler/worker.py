@@ -3,17 +3,23 @@ from threading import Thread
 from inspect import getsource
 
 from crawler.frontier import Frontier
-from utils.download import download
+from crawler import parse_pool, similarity
+from crawler.pages import validators, unchanged
+from utils.download import Downloader
 from utils import get_logger
+from utils.logs import Sampler
+from utils.metrics import get_metrics
 from urllib.parse import urlparse
 import scraper
-import time
 
 class Worker(Thread):
     def __init__(self, worker_id, config, frontier):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier: Frontier = frontier
+        self.downloader = Downloader(config, self.logger)
+        self.metrics = get_metrics()
+        self.sampler = download_sampler(config)
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
         assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
@@ -21,27 +27,100 @@ class Worker(Thread):
         
     def run(self):
         while True:
+            # Includes waiting for a host's politeness delay to pass.
+            start = self.metrics.clock()
             tbd_url = self.frontier.get_tbd_url()
+            self.metrics.stage("frontier_wait", start)
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
-            domain = urlparse(tbd_url).netloc
-            lock = self.frontier.get_domain_lock(domain)
-            with lock:
-                resp = download(tbd_url, self.config, self.logger)
-                self.logger.info(
-                    f"Downloaded {tbd_url}, status <{resp.status}>, "
-                    f"using cache {self.config.cache_server}.")
-                time.sleep(self.config.time_delay)
-            if resp.status == 200 and not resp.error:
-                scraped_urls, tokens = scraper.scraper(tbd_url, resp)
-                if tokens:
-                    self.frontier.update_longest_page(tbd_url, tokens)
-                page_is_new = not self.frontier.is_duplicate_page(tokens)
-                if page_is_new:
-                    self.frontier.add_tokens(tokens)
-                    for scraped_url in scraped_urls:
-                        self.frontier.add_url(scraped_url)
-                domain = urlparse(tbd_url).netloc
-                self.frontier.add_subdomain_count(domain)
+            try:
+                self.process(tbd_url)
+            except Exception:
+                self.logger.exception(f"Failed to process {tbd_url}.")
+            start = self.metrics.clock()
             self.frontier.mark_url_complete(tbd_url)
+            self.metrics.stage("complete", start)
+        self.downloader.close()
+
+    def process(self, tbd_url):
+        # Politeness is enforced by the frontier, which does not hand out
+        # another url of this host until time_delay after the download.
+        resp = None
+        try:
+            resp = self.downloader.download(tbd_url)
+        finally:
+            self.frontier.mark_url_downloaded(tbd_url, resp)
+        log_download(self.logger, self.sampler, self.config, tbd_url, resp)
+        handle_response(
+            self.frontier, tbd_url, resp, parse_pool.get_pool(self.config))
+
+
+def download_sampler(config):
+    return Sampler(config.log_downloads_every, config.log_downloads_per_second)
+
+def log_download(logger, sampler, config, tbd_url, resp):
+    # The line per download, sampled unless the download failed. Carries
+    # its values as fields for structured logs.
+    failed = resp.status != 200 or resp.error
+    if not failed and not sampler.ready():
+        return
+    skipped = sampler.skipped()
+    logger.info(
+        f"Downloaded {tbd_url}, status <{resp.status}>, "
+        f"using cache {config.cache_server}."
+        + (f" Skipped logging {skipped} downloads." if skipped else ""),
+        extra={
+            "url": tbd_url, "status": resp.status, "latency": resp.latency,
+            "skipped": skipped})
+
+def handle_response(frontier, tbd_url, resp, pool=None):
+    # Scrape a downloaded page and feed its links and stats to the frontier.
+    # With a pool, parsing and fingerprinting run in another process.
+    if resp.status == 200 and not resp.error:
+        metrics = get_metrics()
+        previous = page_validators = None
+        if frontier.pages is not None:
+            # Incremental recrawl: a page unchanged since the last visit is
+            # not parsed again.
+            page_validators = validators(resp)
+            previous = frontier.previous_visit(tbd_url)
+            if previous is not None and unchanged(previous, *page_validators):
+                frontier.revisit_unchanged(tbd_url, previous, page_validators)
+                return
+        start = metrics.clock()
+        if pool is None:
+            scraped_urls, tokens = scraper.scraper(tbd_url, resp)
+            digest = fingerprint = None
+        else:
+            scraped_urls, tokens, digest, fingerprint = pool.parse(tbd_url, resp)
+        metrics.stage("parse", start)
+        if tokens:
+            frontier.update_longest_page(tbd_url, tokens)
+        if page_validators is not None and digest is None:
+            digest = similarity.compute_content_digest(tokens)
+        start = metrics.clock()
+        if previous is None:
+            page_is_new = not frontier.is_duplicate_page(tokens, digest, fingerprint)
+        else:
+            # A revisited page is only compared with its own last version,
+            # which unchanged() already found to differ.
+            page_is_new = True
+        metrics.stage("dedupe", start)
+        if page_is_new:
+            if previous is None:
+                # The words of a page count once, for its first version.
+                frontier.add_tokens(tokens)
+            start = metrics.clock()
+            depth = frontier.url_depth(tbd_url) + 1
+            for scraped_url in scraped_urls:
+                frontier.add_url(scraped_url, depth)
+            metrics.stage("add_links", start)
+        if previous is None:
+            domain = urlparse(tbd_url).netloc
+            frontier.add_subdomain_count(domain)
+            # Only a duplicate of another page counts against its pattern.
+            frontier.record_page(tbd_url, not page_is_new)
+        if page_validators is not None:
+            links = scraped_urls if page_is_new else list()
+            frontier.record_visit(tbd_url, previous, page_validators, digest, links)
@@ -7,19 +7,35 @@ from utils.config import Config
 from crawler import Crawler
 
 
-def main(config_file, restart):
+def main(config_file, restart, engine=None, cache_server=None, shards=1):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
+    if engine:
+        config.engine = engine
+    if cache_server:
+        # A local stand-in such as utils/cache_stub.py, no registration.
+        host, port = cache_server.rsplit(":", 1)
+        config.cache_server = (host, int(port))
+    else:
+        config.cache_server = get_cache_server(config, restart)
+    if shards > 1:
+        # One crawler process per shard of the hosts, see crawler/shards.py.
+        from crawler.shards import run_shards
+        run_shards(config_file, shards, restart, engine, config.cache_server)
+        return
     crawler = Crawler(config, restart)
     crawler.start()
     crawler.frontier.print_data()
+    crawler.frontier.close()
 
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default=None)
+    parser.add_argument("--cache_server", type=str, default=None, help="host:port")
+    parser.add_argument("--shards", type=int, default=1, help="crawler processes")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(args.config_file, args.restart, args.engine, args.cache_server, args.shards)
@@ -1,13 +1,16 @@
-import re
-from urllib.parse import urlparse, urldefrag, urljoin
-from bs4 import BeautifulSoup
-from utils.tokenizer import tokenize
+from utils import get_logger
+from utils.extractor import extract
+from utils.url_filter import UrlFilter
 
 MIN_TEXT_RATIO = 0.15
 MIN_UNIQUE_TOKEN_TO_COUNT_RATIO = 0.25
 INVALID_DOMAINS = {"grape.ics.uci.edu"}
 INVALID_SUBDOMAINS = {"/doku.php/", "/~eppstein/junkyard/", "/~eppstein/pix/"}
 INVALID_QUERIES = {"ical", "share"}
+URL_FILTER = UrlFilter(INVALID_DOMAINS, INVALID_SUBDOMAINS, INVALID_QUERIES)
+# Only parse this many bytes of a page, 0 parses all of it. The crawler
+# sets it from MAX_PARSE_BYTES in config.ini.
+MAX_PARSE_BYTES = 0
 
 def scraper(url, resp):
     return extract_next_links(url, resp)
@@ -22,31 +25,33 @@ def extract_next_links(url, resp):
     #         resp.raw_response.url: the url, again
     #         resp.raw_response.content: the content of the page!
     # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
-    tokens = dict()
     if resp.error:
-        print(f"Error in response: {resp.error}")
-        return list(), tokens
-    content_type = resp.raw_response.headers.get("Content-Type")
-    if not content_type or 'text/html' not in content_type:
+        get_logger("SCRAPER").warning(
+            f"Error in response: {resp.error}", extra={"url": url, "status": resp.status})
+        return list(), dict()
+    # Non-html pages are dropped on their Content-Type before the body is
+    # handed to the parser. Reading the headers unpickles the whole page.
+    content_type = resp.headers.get("Content-Type")
+    if not is_html(content_type):
+        return list(), dict()
+    return parse_content(url, resp.content, content_type)
+
+def is_html(content_type):
+    return bool(content_type) and 'text/html' in content_type
+
+def parse_content(url, content, content_type):
+    # Everything extract_next_links does after the response checks. Only
+    # takes plain values so it can run in a separate process.
+    tokens = dict()
+    if not is_html(content_type) or content is None:
         return list(), tokens
-    soup = BeautifulSoup(resp.raw_response.content, 'lxml')
-    text = soup.get_text()
-    tokens = tokenize(text)
-    text_ratio = float(len(text)) / max(len(resp.raw_response.content), 1)
+    # One streaming pass gives the text length, tokens and resolved links.
+    page = extract(url, content, MAX_PARSE_BYTES)
+    tokens = page.tokens
+    text_ratio = float(page.text_length) / max(page.parsed_bytes, 1)
     if text_ratio <= MIN_TEXT_RATIO or len(tokens) / sum(tokens.values()) < MIN_UNIQUE_TOKEN_TO_COUNT_RATIO:
         tokens = dict()
-    a_tags = soup.find_all('a')
-    links = []
-    for tag in a_tags:
-        link = ""
-        href = tag.get('href')
-        if href is None or (isinstance(href, str) and not href.strip()):
-            continue
-        href = str(href)
-        link = urljoin(url, href)
-        link, fragment = urldefrag(link)
-        if is_valid(link):
-            links.append(link)
+    links = validate_many(page.links)
     return links, tokens
 
 def is_valid(url):
@@ -54,39 +59,13 @@ def is_valid(url):
     # If you decide to crawl it, return True; otherwise return False.
     # There are already some conditions that return False.
 
-    # Added check for urls to be within ics, cs, informatics, or stats subdomain    
-    try:
-        date_re = r"\d{4}-\d{2}(?:-\d{2})?" # 2025-05-15, 2025-05
-        parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]) or \
-            parsed.netloc in INVALID_DOMAINS or \
-            "YOUR_IP" in parsed.netloc:
-            return False
-        
-        cur_path = parsed.path.lower() + '/'
-        for path in INVALID_SUBDOMAINS:
-            if path in cur_path:
-                return False
-        
-        
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower()) and \
-                re.match(r"(.*\.)?(ics|cs|informatics|stat)\.uci\.edu.*", parsed.netloc) and \
-                not any(re.search(date_re, query) or query in INVALID_QUERIES for query in re.split(r'[&=]', parsed.query)) and \
-                not re.search(date_re, parsed.path)
-    
-    except TypeError:
-        print ("TypeError for ", parsed)
-        raise
-    except Exception:
-        return False
+    # Added check for urls to be within ics, cs, informatics, or stat subdomain
+    # The rules above are compiled once into URL_FILTER, see utils/url_filter.py
+    return URL_FILTER.is_valid(url)
+
+def validate_many(urls):
+    # is_valid for all the links of a page at once, keeps their order
+    return URL_FILTER.validate_many(urls)
 
 if __name__ == '__main__':
     import code
@@ -0,0 +1,51 @@
+import unittest
+
+import scraper
+
+from crawler import parse_pool
+from tests.util import TempCrawl, make_response
+
+URL = "https://www.ics.uci.edu"
+FIRST = "https://www.ics.uci.edu/first"
+LAST = "https://www.ics.uci.edu/last"
+
+
+def long_page():
+    words = " ".join(f"word{number}" for number in range(2000))
+    return (
+        f'<html><body><a href="{FIRST}">first</a><p>{words}</p>'
+        f'<a href="{LAST}">last</a></body></html>').encode("utf-8")
+
+
+class MaxParseBytesTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = scraper.MAX_PARSE_BYTES
+
+    def tearDown(self):
+        scraper.MAX_PARSE_BYTES = self.saved
+
+    def test_whole_page_by_default(self):
+        scraper.MAX_PARSE_BYTES = 0
+        links, tokens = scraper.scraper(URL, make_response(URL, 200, long_page()))
+        self.assertEqual(links, [FIRST, LAST])
+
+    def test_cap(self):
+        scraper.MAX_PARSE_BYTES = 1000
+        links, tokens = scraper.scraper(URL, make_response(URL, 200, long_page()))
+        self.assertEqual(links, [FIRST])
+        self.assertLess(sum(tokens.values()), 2000)
+
+    def test_config_reaches_the_pool(self):
+        crawl = TempCrawl({("LOCAL PROPERTIES", "MAX_PARSE_BYTES"): "1000"})
+        pool = parse_pool.ParsePool(1, crawl.config.max_parse_bytes)
+        try:
+            links, tokens, digest, fingerprint = pool.parse(
+                URL, make_response(URL, 200, long_page()))
+            self.assertEqual(links, [FIRST])
+        finally:
+            pool.shutdown()
+            crawl.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
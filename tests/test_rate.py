@@ -0,0 +1,43 @@
+import unittest
+
+from crawler.rate import RateController
+
+
+class RateControllerTest(unittest.TestCase):
+    def test_healthy_host_keeps_min_delay(self):
+        rate = RateController(0.5, 30)
+        for _ in range(10):
+            # Slow answers alone do not slow a host down.
+            self.assertEqual(rate.observe("a.ics.uci.edu", 200, latency=5.0), 0.5)
+
+    def test_server_errors_back_off(self):
+        rate = RateController(0.5, 30)
+        self.assertEqual(rate.observe("a.ics.uci.edu", 503), 1.0)
+        self.assertEqual(rate.observe("a.ics.uci.edu", 0), 2.0)
+        self.assertEqual(rate.observe("a.ics.uci.edu", 429), 4.0)
+        self.assertEqual(rate.observe("a.ics.uci.edu", 200), 3.5)
+        self.assertEqual(rate.delay("b.ics.uci.edu"), 0.5)
+
+    def test_cache_server_statuses_do_not_back_off(self):
+        rate = RateController(0.5, 30)
+        for status in (600, 601, 603, 604, 605, 606, 607, 608):
+            self.assertEqual(rate.observe("a.ics.uci.edu", status), 0.5)
+        self.assertEqual(rate.state()["a.ics.uci.edu"][2], 0)
+
+    def test_retry_after_and_max_delay(self):
+        rate = RateController(0.5, 30)
+        self.assertEqual(rate.observe("a.ics.uci.edu", 503, wait=10), 10)
+        self.assertEqual(rate.observe("a.ics.uci.edu", 503, wait=100), 30)
+
+    def test_zero_politeness_backs_off(self):
+        rate = RateController(0, 30)
+        self.assertEqual(rate.observe("a.ics.uci.edu", 200), 0)
+        self.assertEqual(rate.observe("a.ics.uci.edu", 503), 1.0)
+        self.assertEqual(rate.observe("a.ics.uci.edu", 429), 2.0)
+        self.assertEqual(rate.observe("a.ics.uci.edu", 0), 4.0)
+        for delay in (3.5, 3.0, 2.5, 2.0, 1.5, 1.0, 0.5, 0, 0):
+            self.assertEqual(rate.observe("a.ics.uci.edu", 200), delay)
+
+
+if __name__ == "__main__":
+    unittest.main()
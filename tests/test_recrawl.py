@@ -0,0 +1,72 @@
+import unittest
+
+from crawler.frontier import Frontier
+from crawler.worker import handle_response
+from tests.util import TempCrawl, low_text_page, make_response
+
+URL = "https://www.stat.uci.edu"
+
+
+def page(words):
+    return f"<html><body><p>{' '.join(words)}</p></body></html>".encode("utf-8")
+
+
+class RecrawlTest(unittest.TestCase):
+    def setUp(self):
+        self.crawl = TempCrawl({
+            ("CRAWLER", "SEEDURL"): URL, ("CRAWLER", "RECRAWL"): "on"})
+        self.frontier = Frontier(self.crawl.config, True)
+
+    def tearDown(self):
+        self.frontier.close()
+        self.crawl.cleanup()
+
+    def visit(self, content):
+        url = self.frontier.get_tbd_url()
+        self.assertEqual(url, URL)
+        handle_response(self.frontier, url, make_response(url, 200, content))
+        self.frontier.mark_url_complete(url)
+        # Queued again as a due revisit would be.
+        self.frontier.scheduler.put(url)
+
+    def test_revisits_do_not_count_words_again(self):
+        first = [f"statistics{number}" for number in range(40)]
+        self.visit(page(first))
+        counts = dict(self.frontier.get_tokens().most_common())
+        self.assertEqual(self.frontier.get_tokens().total, 40)
+        # Unchanged: not parsed again.
+        self.visit(page(first))
+        # Changed: parsed, but its words are not counted a second time.
+        self.visit(page(first[:20] + [f"probability{number}" for number in range(20)]))
+        self.assertEqual(self.frontier.get_tokens().total, 40)
+        self.assertEqual(dict(self.frontier.get_tokens().most_common()), counts)
+        self.assertEqual(self.frontier.pages.revisits, {"unchanged": 1, "changed": 1})
+        self.assertEqual(self.frontier.get_subdomain_count(), {"www.stat.uci.edu": 1})
+
+    def drain(self):
+        urls = list()
+        while True:
+            url, wait = self.frontier.poll_tbd_url()
+            if url is None:
+                return urls
+            urls.append(url)
+            self.frontier.mark_url_complete(url)
+
+    def test_changed_low_text_page_queues_its_new_links(self):
+        # Pages without tokens all have the same digest; their body decides.
+        old = [f"{URL}/old/{number}" for number in range(3)]
+        new = [f"{URL}/new/{number}" for number in range(3)]
+        for links in (old, new):
+            url = self.frontier.get_tbd_url()
+            self.assertEqual(url, URL)
+            handle_response(self.frontier, url, make_response(url, 200, low_text_page(links)))
+            self.frontier.mark_url_complete(url)
+            self.assertEqual(sorted(self.drain()), links)
+            self.frontier.scheduler.put(URL)
+        self.assertEqual(self.frontier.pages.revisits, {"unchanged": 0, "changed": 1})
+        previous = self.frontier.previous_visit(URL)
+        self.assertEqual(previous.links(), new)
+        self.assertEqual(previous.interval, self.crawl.config.recrawl_min_interval)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import pickle
+import unittest
+
+import cbor
+import requests
+
+from requests.structures import CaseInsensitiveDict
+
+from utils.response import Response
+
+URL = "https://www.ics.uci.edu/"
+HEADERS = {"Content-Type": "text/html", "ETag": '"abc"'}
+
+
+def pickled_response(content, protocol=pickle.HIGHEST_PROTOCOL):
+    raw = requests.models.Response()
+    raw._content = content
+    raw.status_code = 200
+    raw.url = URL
+    raw.headers = CaseInsensitiveDict(HEADERS)
+    return pickle.dumps(raw, protocol=protocol)
+
+
+def response(payload, status=200, max_body_bytes=0):
+    resp_dict = {"url": URL, "status": status}
+    if payload is not None:
+        resp_dict["response"] = payload
+    return Response(cbor.loads(cbor.dumps(resp_dict)), max_body_bytes)
+
+
+class ResponseTest(unittest.TestCase):
+    def test_every_protocol(self):
+        content = b"<html>" + b"w" * 2000 + b"</html>"
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            with self.subTest(protocol=protocol):
+                resp = response(pickled_response(content, protocol))
+                self.assertEqual(bytes(resp.content), content)
+                self.assertEqual(dict(resp.headers), HEADERS)
+                self.assertEqual(resp.raw_response.status_code, 200)
+
+    def test_decoded_on_first_use(self):
+        resp = response(pickled_response(b"<html></html>"))
+        self.assertEqual(resp.status, 200)
+        self.assertIsNotNone(resp.payload)
+        self.assertIs(resp.headers, resp.raw_response.headers)
+
+    def test_no_response(self):
+        resp = response(None, 404)
+        self.assertIsNone(resp.raw_response)
+        self.assertIsNone(resp.content)
+        self.assertEqual(dict(resp.headers), {})
+
+    def test_no_body(self):
+        resp = response(pickled_response(None))
+        self.assertIsNone(resp.content)
+        self.assertEqual(dict(resp.headers), HEADERS)
+
+    def test_truncated(self):
+        payload = pickled_response(b"z" * 1000)
+        for size in (0, 1, 10, 100, 500, len(payload) - 1):
+            with self.subTest(size=size):
+                resp = response(payload[:size])
+                self.assertIsNone(resp.raw_response)
+                self.assertIsNone(resp.content)
+                self.assertEqual(dict(resp.headers), {})
+
+    def test_malformed(self):
+        for payload in (b"not a pickle", b"\x80\x05\xff\xff"):
+            with self.subTest(payload=payload):
+                self.assertIsNone(response(payload).raw_response)
+
+    def test_max_body_bytes(self):
+        resp = response(pickled_response(b"v" * 50000), max_body_bytes=10000)
+        self.assertIsNone(resp.content)
+        self.assertIn("over 10000 bytes", resp.error)
+        resp = response(pickled_response(b"v" * 500), max_body_bytes=10000)
+        self.assertEqual(bytes(resp.content), b"v" * 500)
+        self.assertIsNone(resp.error)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from crawler.scheduler import HostScheduler
+
+
+class HostSchedulerTest(unittest.TestCase):
+    def test_one_fetch_per_host(self):
+        scheduler = HostScheduler(0)
+        scheduler.put("http://a.ics.uci.edu/1")
+        scheduler.put("http://a.ics.uci.edu/2")
+        url, wait = scheduler.poll()
+        self.assertEqual(url, "http://a.ics.uci.edu/1")
+        self.assertEqual(scheduler.poll(), (None, -1))
+        scheduler.release(url)
+        self.assertEqual(scheduler.poll()[0], "http://a.ics.uci.edu/2")
+
+    def test_stale_done_keeps_host_busy(self):
+        # The first url is downloaded and its host released, the second is
+        # handed out, and only then does the work of the first finish.
+        scheduler = HostScheduler(0)
+        for path in ("1", "2", "3"):
+            scheduler.put("http://a.ics.uci.edu/" + path)
+        first = scheduler.poll()[0]
+        scheduler.release(first)
+        second = scheduler.poll()[0]
+        self.assertEqual(second, "http://a.ics.uci.edu/2")
+        scheduler.done(first)
+        self.assertEqual(scheduler.poll(), (None, -1))
+        scheduler.release(second)
+        self.assertEqual(scheduler.poll()[0], "http://a.ics.uci.edu/3")
+
+    def test_discard_frees_only_its_host(self):
+        scheduler = HostScheduler(0)
+        scheduler.put("http://a.ics.uci.edu/1")
+        scheduler.put("http://a.ics.uci.edu/2")
+        scheduler.put("http://b.ics.uci.edu/1")
+        first = scheduler.poll()[0]
+        other = scheduler.poll()[0]
+        self.assertEqual(other, "http://b.ics.uci.edu/1")
+        scheduler.discard(other)
+        self.assertEqual(scheduler.poll(), (None, -1))
+        scheduler.done(first)
+        self.assertEqual(scheduler.poll()[0], "http://a.ics.uci.edu/2")
+
+    def test_finished(self):
+        scheduler = HostScheduler(0)
+        scheduler.put("http://a.ics.uci.edu/1")
+        url = scheduler.poll()[0]
+        scheduler.done(url)
+        self.assertEqual(scheduler.poll(), (None, None))
+
+    def test_on_change(self):
+        changes = list()
+        scheduler = HostScheduler(0)
+        scheduler.on_change = lambda: changes.append(scheduler.queued)
+        scheduler.put("http://a.ics.uci.edu/1")
+        self.assertEqual(changes, [1])
+        url = scheduler.poll()[0]
+        scheduler.release(url)
+        scheduler.done(url)
+        self.assertEqual(changes, [1, 0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from crawler.store import SqliteStore
+
+
+class SqliteStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="crawler-test-")
+        self.path = os.path.join(self.directory, "urls.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def committed(self):
+        # What another connection, or the file after a crash, sees.
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_batch_is_committed_without_further_writes(self):
+        store = SqliteStore(self.path, batch_size=500, batch_seconds=0.1)
+        try:
+            self.assertTrue(store.add("a", "https://www.ics.uci.edu/a"))
+            self.assertTrue(store.add("b", "https://www.ics.uci.edu/b"))
+            self.assertEqual(self.committed(), 0)
+            deadline = time.monotonic() + 5
+            while self.committed() < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(self.committed(), 2)
+        finally:
+            store.close()
+
+    def test_batch_size(self):
+        store = SqliteStore(self.path, batch_size=2, batch_seconds=60)
+        try:
+            store.add("a", "https://www.ics.uci.edu/a")
+            self.assertEqual(self.committed(), 0)
+            store.add("b", "https://www.ics.uci.edu/b")
+            self.assertEqual(self.committed(), 2)
+        finally:
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
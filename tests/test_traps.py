@@ -0,0 +1,101 @@
+import os
+import unittest
+
+from crawler.frontier import Frontier
+from crawler.traps import (
+    DEPTH_MIN_SAMPLES, MAX_PARAM_SETS, MIN_PATTERN_PAGES, TrapDetector)
+from crawler.worker import handle_response
+from tests.util import TempCrawl, make_response
+
+SEED = "https://www.informatics.uci.edu"
+
+
+class TrapDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.crawl = TempCrawl()
+        self.traps = TrapDetector(os.path.join(self.crawl.directory, "traps"), True)
+
+    def tearDown(self):
+        self.crawl.cleanup()
+
+    def test_duplicates_make_a_trap(self):
+        for day in range(MIN_PATTERN_PAGES):
+            url = f"https://www.ics.uci.edu/calendar/{day}"
+            self.assertTrue(self.traps.allow(url))
+            self.traps.record_page(url, True)
+        self.assertTrue(self.traps.is_trap("https://www.ics.uci.edu/calendar/99"))
+        self.assertFalse(self.traps.allow("https://www.ics.uci.edu/calendar/100"))
+        self.assertTrue(self.traps.allow("https://www.ics.uci.edu/about"))
+
+    def test_new_pages_are_no_trap(self):
+        for day in range(2 * MIN_PATTERN_PAGES):
+            self.traps.record_page(f"https://www.ics.uci.edu/calendar/{day}", False)
+        self.assertFalse(self.traps.is_trap("https://www.ics.uci.edu/calendar/99"))
+
+    def test_repeated_segments(self):
+        self.assertFalse(self.traps.allow("https://www.ics.uci.edu/a/b/a/b/a/b"))
+
+    def shallow_host(self, wasted):
+        # More than DEPTH_MIN_SAMPLES urls two segments deep, and as many
+        # fetched pages, duplicates or not.
+        urls = [f"https://www.ics.uci.edu/people/{number}" for number in range(
+            DEPTH_MIN_SAMPLES + 50)]
+        for url in urls:
+            self.assertTrue(self.traps.allow(url))
+        for url in urls:
+            self.traps.record_page(url, wasted)
+        deep = "https://www.ics.uci.edu/a/b/c/d/e/f/g"
+        return self.traps.allow(deep)
+
+    def test_deep_url_of_healthy_host_is_allowed(self):
+        self.assertTrue(self.shallow_host(False))
+
+    def test_deep_url_of_wasteful_host_is_rejected(self):
+        self.assertFalse(self.shallow_host(True))
+
+    def test_id_listing_is_allowed(self):
+        for number in range(1000):
+            self.assertTrue(self.traps.allow(
+                f"https://www.ics.uci.edu/community/news/view_news?id={number}"))
+
+    def test_too_many_parameter_sets(self):
+        path = "https://www.ics.uci.edu/search"
+        for number in range(MAX_PARAM_SETS):
+            self.assertTrue(self.traps.allow(f"{path}?filter{number}=1&page=2"))
+        self.assertFalse(self.traps.allow(f"{path}?filter{MAX_PARAM_SETS}=1&page=2"))
+        # Parameter sets seen before the path was closed are still allowed,
+        # also after a resume.
+        self.assertTrue(self.traps.allow(f"{path}?filter0=7&page=3"))
+        self.traps.close()
+        resumed = TrapDetector(self.traps.path, False)
+        self.assertTrue(resumed.allow(f"{path}?filter1=7&page=3"))
+        self.assertFalse(resumed.allow(f"{path}?other=1"))
+
+
+class ErrorPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.crawl = TempCrawl({("CRAWLER", "SEEDURL"): SEED})
+        self.frontier = Frontier(self.crawl.config, True)
+
+    def tearDown(self):
+        self.frontier.close()
+        self.crawl.cleanup()
+
+    def test_transient_server_errors_are_no_trap(self):
+        url = self.frontier.get_tbd_url()
+        self.frontier.mark_url_complete(url)
+        for number in range(2 * MIN_PATTERN_PAGES):
+            self.frontier.add_url(f"{SEED}/events/{number}")
+        for _ in range(2 * MIN_PATTERN_PAGES):
+            url, wait = self.frontier.poll_tbd_url()
+            self.assertIsNotNone(url)
+            handle_response(
+                self.frontier, url, make_response(url, 503, error="Service Unavailable"))
+            self.frontier.mark_url_downloaded(url)
+            self.frontier.mark_url_complete(url)
+        self.assertFalse(self.frontier.traps.traps)
+        self.assertEqual(self.frontier.poll_tbd_url(), (None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
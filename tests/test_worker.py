@@ -0,0 +1,42 @@
+import unittest
+
+from crawler.frontier import Frontier
+from crawler.worker import handle_response
+from tests.util import TempCrawl, low_text_page, make_response
+
+SEED = "https://www.ics.uci.edu"
+
+
+class HandleResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.crawl = TempCrawl()
+        self.frontier = Frontier(self.crawl.config, True)
+
+    def tearDown(self):
+        self.frontier.close()
+        self.crawl.cleanup()
+
+    def test_low_text_page_links_are_queued(self):
+        url = self.frontier.get_tbd_url()
+        self.assertEqual(url, SEED)
+        links = [f"https://www.ics.uci.edu/low-text/{number}" for number in range(5)]
+        handle_response(self.frontier, url, make_response(url, 200, low_text_page(links)))
+        self.frontier.mark_url_complete(url)
+        queued = set()
+        while True:
+            url, wait = self.frontier.poll_tbd_url()
+            if url is None:
+                break
+            queued.add(url)
+            self.frontier.mark_url_complete(url)
+        self.assertEqual(queued, set(links))
+
+    def test_error_page_adds_nothing(self):
+        url = self.frontier.get_tbd_url()
+        handle_response(self.frontier, url, make_response(url, 404, error="Not found"))
+        self.frontier.mark_url_complete(url)
+        self.assertEqual(self.frontier.poll_tbd_url(), (None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+
+from configparser import ConfigParser
+
+import cbor
+
+from utils.cache_stub import encode_response
+from utils.config import Config
+from utils.response import Response
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.ini")
+
+
+class TempCrawl(object):
+    ''' A Config whose save files are in a fresh directory, removed by
+        cleanup(). options maps (section, key) to a value that replaces the
+        one in config.ini. '''
+    def __init__(self, options=None):
+        self.directory = tempfile.mkdtemp(prefix="crawler-test-")
+        parser = ConfigParser()
+        parser.read(CONFIG_FILE)
+        parser["LOCAL PROPERTIES"]["SAVE"] = f"{self.directory}/frontier.shelve"
+        parser["CRAWLER"]["SEEDURL"] = "https://www.ics.uci.edu"
+        parser["CRAWLER"]["POLITENESS"] = "0"
+        for (section, key), value in (options or dict()).items():
+            parser[section][key] = value
+        self.config = Config(parser)
+        self.config.cache_server = ("127.0.0.1", 0)
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def make_response(url, status=200, content=None, content_type="text/html", error=None):
+    ''' The Response the downloader returns when the cache server sends
+        these values. '''
+    return Response(cbor.loads(encode_response(url, status, content, content_type, error)))
+
+
+def low_text_page(links):
+    # Mostly markup: the scraper keeps its links but no tokens.
+    anchors = "".join(
+        f'<div class="navigation-item-wrapper"><a href="{link}">x</a></div>'
+        for link in links)
+    return f"<html><body>{anchors}</body></html>".encode("utf-8")
@@ -1,26 +1,9 @@
-import os
-import logging
 from hashlib import sha256
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit, urlunsplit
 
-def get_logger(name, filename=None):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    if not os.path.exists("Logs"):
-        os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
-    fh.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-       "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
-    return logger
+from utils.logs import get_logger
 
+DEFAULT_PORTS = {"http": "80", "https": "443"}
 
 def get_urlhash(url):
     parsed = urlparse(url)
@@ -33,3 +16,25 @@ def normalize(url):
     if url.endswith("/"):
         return url.rstrip("/")
     return url
+
+def canonicalize(url):
+    ''' One spelling per url: lowercase scheme and host, no default port,
+        no fragment, query parameters sorted by name (values of a repeated
+        name keep their order) and no trailing slash, as in normalize. '''
+    try:
+        parsed = urlsplit(url)
+    except ValueError:
+        return normalize(url)
+    scheme = parsed.scheme.lower()
+    userinfo, at, hostport = parsed.netloc.rpartition("@")
+    host, colon, port = hostport.rpartition(":")
+    if not colon or "]" in port:
+        # No port, or a bracketed IPv6 address without one.
+        host, port = hostport, ""
+    netloc = f"{userinfo}{at}{host.lower()}"
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc += f":{port}"
+    query = "&".join(sorted(
+        (param for param in parsed.query.split("&") if param),
+        key=lambda param: param.partition("=")[0]))
+    return normalize(urlunsplit((scheme, netloc, parsed.path, query, "")))
@@ -0,0 +1,274 @@
+''' Local stand-in for the spacetime cache server.
+
+    Speaks the same protocol as the real cache: GET /?q=<url>&u=<user agent>
+    answered with a CBOR dict holding url, status and the pickled
+    requests.Response. Pages come from a corpus recorded by the downloader
+    (see RECORD_CORPUS in config.ini) or from a synthetic link graph, with
+    optional latency and error injection, so crawls can be replayed and
+    timed without the UCI cache.
+
+        python -m utils.cache_stub --port 9000 --synthetic
+        python launch.py --restart --cache_server 127.0.0.1:9000
+'''
+import pickle
+import random
+import struct
+import time
+
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Thread
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+
+from requests.structures import CaseInsensitiveDict
+
+RECORD_HEADER = struct.Struct(">I")
+# Cache specific error status (600-606) for urls missing from a corpus.
+NOT_CACHED_STATUS = 600
+NOT_FOUND_PAGE = b"<html><body><h1>Not Found</h1></body></html>"
+DEFAULT_HOSTS = (
+    "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu",
+    "www.stat.uci.edu", "vision.ics.uci.edu", "wics.ics.uci.edu")
+WORDS = (
+    "crawler index search query page link web graph token document "
+    "ranking retrieval frequency vector model score cluster learning "
+    "network data system student research course faculty project").split()
+
+
+def encode_response(url, status, content=None, content_type="text/html", error=None):
+    ''' The CBOR body the cache server sends for url. '''
+    resp = {"url": url, "status": status}
+    if error is not None:
+        resp["error"] = error
+    if content is not None:
+        raw = requests.models.Response()
+        raw._content = content
+        raw.status_code = status
+        raw.url = url
+        raw.headers = CaseInsensitiveDict({"Content-Type": content_type})
+        resp["response"] = pickle.dumps(raw)
+    return cbor.dumps(resp)
+
+
+class CorpusRecorder(object):
+    ''' Appends (url, CBOR body) records to a corpus file, one length
+        prefixed CBOR pair per response. Shared by every downloader of
+        the process. '''
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.corpus_file = open(path, "ab")
+
+    def record(self, url, body):
+        record = cbor.dumps([url, body])
+        with self.lock:
+            self.corpus_file.write(RECORD_HEADER.pack(len(record)) + record)
+            self.corpus_file.flush()
+
+    def close(self):
+        with self.lock:
+            self.corpus_file.close()
+
+
+_recorders = dict()
+_recorders_lock = Lock()
+
+def get_recorder(path):
+    # One recorder per corpus path, so threads never interleave records.
+    with _recorders_lock:
+        if path not in _recorders:
+            _recorders[path] = CorpusRecorder(path)
+        return _recorders[path]
+
+
+class Corpus(object):
+    ''' Responses recorded by CorpusRecorder, keyed by url. A url recorded
+        more than once keeps its last response and a partial trailing
+        record is ignored. '''
+    def __init__(self, path):
+        self.pages = dict()
+        with open(path, "rb") as corpus_file:
+            data = corpus_file.read()
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            size, = RECORD_HEADER.unpack_from(data, offset)
+            offset += RECORD_HEADER.size
+            if offset + size > len(data):
+                break
+            url, body = cbor.loads(data[offset:offset + size])
+            self.pages[url] = body
+            offset += size
+
+    def __len__(self):
+        return len(self.pages)
+
+    def get(self, url):
+        return self.pages.get(url)
+
+
+class SyntheticGraph(object):
+    ''' Deterministic html pages for https://<host>/p<n>. Every page links
+        to links_per_page other pages, mostly on its own host, plus the
+        odd off-site or binary link for the scraper to filter. The same
+        url always gives the same page. '''
+    def __init__(self, hosts=DEFAULT_HOSTS, pages_per_host=500,
+                 links_per_page=10, words_per_page=300, seed=0):
+        self.hosts = list(hosts)
+        self.pages_per_host = pages_per_host
+        self.links_per_page = links_per_page
+        self.words_per_page = words_per_page
+        self.seed = seed
+
+    def __len__(self):
+        return len(self.hosts) * self.pages_per_host
+
+    def links(self, rng, host):
+        for _ in range(self.links_per_page):
+            roll = rng.random()
+            if roll < 0.05:
+                yield f"https://example.com/p{rng.randrange(self.pages_per_host)}"
+            elif roll < 0.1:
+                yield f"https://{host}/files/f{rng.randrange(self.pages_per_host)}.pdf"
+            else:
+                target = host if roll < 0.8 else rng.choice(self.hosts)
+                yield f"https://{target}/p{rng.randrange(self.pages_per_host)}"
+
+    def get(self, url):
+        parsed = urlparse(url)
+        path = parsed.path.strip("/")
+        if parsed.netloc not in self.hosts or not (
+                path == "" or path[1:].isdigit() and path[0] == "p"
+                and int(path[1:]) < self.pages_per_host):
+            return encode_response(url, 404, NOT_FOUND_PAGE)
+        rng = random.Random(f"{self.seed}:{url}")
+        words = " ".join(
+            f"{rng.choice(WORDS)}{rng.randrange(50)}"
+            for _ in range(rng.randint(self.words_per_page // 2, self.words_per_page)))
+        anchors = "".join(
+            f'<li><a href="{link}">{link}</a></li>'
+            for link in self.links(rng, parsed.netloc))
+        html = (
+            f"<html><head><title>{url}</title></head><body>"
+            f"<p>{words}</p><ul>{anchors}</ul></body></html>")
+        return encode_response(url, 200, html.encode("utf-8"))
+
+
+class CacheStub(object):
+    ''' Threaded http server answering cache requests from pages, an object
+        with get(url) returning the CBOR body or None. Each request waits
+        latency seconds plus up to jitter more, and error_rate of them get
+        an http 503 with no body. '''
+    def __init__(self, pages, host="127.0.0.1", port=0, latency=0.0,
+                 jitter=0.0, error_rate=0.0, seed=0):
+        self.pages = pages
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = Lock()
+        self.served = 0
+        self.errors = 0
+        self.missing = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                if "q" not in query or "u" not in query:
+                    self.send_error(400, "Expected q and u parameters.")
+                    return
+                status, body = stub.answer(query["q"][0])
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def answer(self, url):
+        ''' (http status, body) for one request. '''
+        with self.lock:
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            failed = self.rng.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            with self.lock:
+                self.errors += 1
+            return 503, b""
+        body = self.pages.get(url)
+        with self.lock:
+            self.served += 1
+            if body is None:
+                self.missing += 1
+        if body is None:
+            body = encode_response(
+                url, NOT_CACHED_STATUS, error=f"{url} is not in the corpus.")
+        return 200, body
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0].strip(" '"))
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--corpus", type=str, help="file written with RECORD_CORPUS")
+    source.add_argument("--synthetic", action="store_true")
+    parser.add_argument("--hosts", type=str, default=",".join(DEFAULT_HOSTS))
+    parser.add_argument("--pages_per_host", type=int, default=500)
+    parser.add_argument("--links_per_page", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.corpus:
+        pages = Corpus(args.corpus)
+    else:
+        pages = SyntheticGraph(
+            args.hosts.split(","), args.pages_per_host, args.links_per_page,
+            seed=args.seed)
+    stub = CacheStub(
+        pages, args.host, args.port, args.latency, args.jitter,
+        args.error_rate, args.seed)
+    host, port = stub.address
+    print(f"Serving {len(pages)} pages on {host}:{port}.")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+        print(
+            f"Served {stub.served} requests, {stub.missing} missing, "
+            f"{stub.errors} injected errors.")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,12 +8,51 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.engine = config["LOCAL PROPERTIES"].get("ENGINE", "threads").strip()
+        self.async_tasks = int(config["LOCAL PROPERTIES"].get("ASYNC_TASKS", "200"))
+        self.parse_processes = int(config["LOCAL PROPERTIES"].get("PARSE_PROCESSES", "0"))
+        self.max_parse_bytes = int(config["LOCAL PROPERTIES"].get("MAX_PARSE_BYTES", "0"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.store = config["LOCAL PROPERTIES"].get("STORE", "sqlite").strip()
+        self.store_file = f"{self.save_file}.sqlite"
+        self.store_batch_size = int(config["LOCAL PROPERTIES"].get("STORE_BATCH_SIZE", "500"))
+        self.store_batch_seconds = float(config["LOCAL PROPERTIES"].get("STORE_BATCH_SECONDS", "1.0"))
+        self.stats_file = f"{self.save_file}.stats"
+        self.dedupe_file = f"{self.save_file}.dedupe"
+        self.checkpoint_pages = int(config["LOCAL PROPERTIES"].get("CHECKPOINT_PAGES", "100"))
+        self.checkpoint_seconds = float(config["LOCAL PROPERTIES"].get("CHECKPOINT_SECONDS", "30"))
+        self.token_top_words = int(config["LOCAL PROPERTIES"].get("TOKEN_TOP_WORDS", "10000"))
+        self.token_sketch_width = int(config["LOCAL PROPERTIES"].get("TOKEN_SKETCH_WIDTH", "131072"))
+        self.frontier_memory_urls = int(config["LOCAL PROPERTIES"].get("FRONTIER_MEMORY_URLS", "500000"))
+        self.frontier_segment_urls = int(config["LOCAL PROPERTIES"].get("FRONTIER_SEGMENT_URLS", "10000"))
+        self.load_batch_size = int(config["LOCAL PROPERTIES"].get("LOAD_BATCH_SIZE", "1000"))
+        self.metrics = config["LOCAL PROPERTIES"].getboolean("METRICS", False)
+        self.metrics_port = int(config["LOCAL PROPERTIES"].get("METRICS_PORT", "9100"))
+        self.metrics_snapshot_seconds = float(config["LOCAL PROPERTIES"].get("METRICS_SNAPSHOT_SECONDS", "10"))
+        self.metrics_file = f"{self.save_file}.metrics.json"
+        self.log_format = config["LOCAL PROPERTIES"].get("LOG_FORMAT", "text").strip()
+        self.log_downloads_every = int(config["LOCAL PROPERTIES"].get("LOG_DOWNLOADS_EVERY", "1"))
+        self.log_downloads_per_second = float(config["LOCAL PROPERTIES"].get("LOG_DOWNLOADS_PER_SECOND", "0"))
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.connect_timeout = float(config["CONNECTION"].get("CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(config["CONNECTION"].get("READ_TIMEOUT", "30"))
+        self.download_retries = int(config["CONNECTION"].get("RETRIES", "3"))
+        self.download_backoff = float(config["CONNECTION"].get("BACKOFF", "0.5"))
+        self.max_response_bytes = int(config["CONNECTION"].get("MAX_RESPONSE_BYTES", str(20 * 1024 * 1024)))
+        self.max_body_bytes = int(config["CONNECTION"].get("MAX_BODY_BYTES", str(5 * 1024 * 1024)))
+        self.record_corpus = config["CONNECTION"].get("RECORD_CORPUS", "").strip()
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.adaptive_politeness = config["CRAWLER"].getboolean("ADAPTIVE_POLITENESS", False)
+        self.max_time_delay = float(config["CRAWLER"].get("MAX_POLITENESS", "30"))
+        self.trap_detection = config["CRAWLER"].getboolean("TRAP_DETECTION", True)
+        self.traps_file = f"{self.save_file}.traps"
+        self.recrawl = config["CRAWLER"].getboolean("RECRAWL", False)
+        self.recrawl_min_interval = float(config["CRAWLER"].get("RECRAWL_MIN_INTERVAL", "3600"))
+        self.recrawl_max_interval = float(config["CRAWLER"].get("RECRAWL_MAX_INTERVAL", "2592000"))
+        self.pages_file = f"{self.save_file}.pages.sqlite"
 
         self.cache_server = None
\ No newline at end of file
@@ -1,21 +1,205 @@
+import asyncio
 import requests
 import cbor
 import time
 
+from threading import local
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from utils.response import Response
+from utils.cache_stub import get_recorder
+from utils.metrics import get_metrics
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Status used when no response came back from the cache server at all.
+TRANSPORT_ERROR_STATUS = 0
+RETRY_STATUSES = (500, 502, 503, 504)
+CHUNK_SIZE = 64 * 1024
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+class BaseDownloader(object):
+    def _error(self, message, status, url):
+        if self.logger:
+            self.logger.error(message)
+        return Response({"error": message, "status": status, "url": url})
+
+    def _decode(self, url, content):
+        # Raises like cbor.loads; the raw body goes to the corpus if recording.
+        response = Response(cbor.loads(content), self.config.max_body_bytes)
+        if self.recorder is not None:
+            self.recorder.record(url, content)
+        return response
+
+    def _record(self, start, response):
+        self.last_latency = time.perf_counter() - start
+        self.requests += 1
+        self.total_latency += self.last_latency
+        response.latency = self.last_latency
+        metrics = get_metrics()
+        if metrics.enabled:
+            metrics.observe(
+                "crawler_stage_seconds", (("stage", "download"),), self.last_latency)
+            metrics.inc("crawler_responses_total", (("status", response.status),))
+            if response.payload is not None:
+                # The size of the pickled page, a little over its body, so
+                # the page is not unpickled here.
+                metrics.page(urlparse(response.url).netloc, len(response.payload))
+        return response
+
+
+class Downloader(BaseDownloader):
+    ''' Fetches urls through the cache server over one pooled keep-alive
+        session. Each worker owns one; a Downloader is not shared between
+        threads. '''
+    def __init__(self, config, logger=None):
+        self.config = config
+        self.logger = logger
+        self.timeout = (config.connect_timeout, config.read_timeout)
+        self.max_bytes = config.max_response_bytes
+        self.recorder = get_recorder(config.record_corpus) if config.record_corpus else None
+        retry = Retry(
+            total=config.download_retries,
+            backoff_factor=config.download_backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False)
+        self.session = requests.Session()
+        self.session.mount(
+            "http://", HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retry))
+        self.requests = 0
+        self.total_latency = 0.0
+        self.last_latency = None
+
+    def download(self, url):
+        host, port = self.config.cache_server
+        start = time.perf_counter()
+        try:
+            with self.session.get(
+                    f"http://{host}:{port}/",
+                    params=[("q", f"{url}"), ("u", f"{self.config.user_agent}")],
+                    timeout=self.timeout, stream=True) as resp:
+                content = self._read(resp)
+        except ResponseTooLarge as e:
+            return self._record(start, self._error(
+                f"Spacetime response too large ({e}) with url {url}.",
+                resp.status_code, url))
+        except requests.RequestException as e:
+            return self._record(start, self._error(
+                f"Spacetime download error {e!r} with url {url}.",
+                TRANSPORT_ERROR_STATUS, url))
+        try:
+            if resp and content:
+                return self._record(start, self._decode(url, content))
+        except (EOFError, ValueError) as e:
+            pass
+        return self._record(start, self._error(
+            f"Spacetime Response error {resp} with url {url}.",
+            resp.status_code, url))
+
+    def _read(self, resp):
+        length = resp.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise ResponseTooLarge(f"{length} bytes")
+        body = bytearray()
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            body += chunk
+            if len(body) > self.max_bytes:
+                raise ResponseTooLarge(f"more than {self.max_bytes} bytes")
+        return bytes(body)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncDownloader(BaseDownloader):
+    ''' asyncio counterpart of Downloader built on one aiohttp session that
+        is shared by every fetch task of an event loop. Use it as an async
+        context manager. '''
+    def __init__(self, config, logger=None):
+        if aiohttp is None:
+            raise RuntimeError("The asyncio engine needs aiohttp installed.")
+        self.config = config
+        self.logger = logger
+        self.max_bytes = config.max_response_bytes
+        self.recorder = get_recorder(config.record_corpus) if config.record_corpus else None
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=config.connect_timeout, sock_read=config.read_timeout)
+        self.session = None
+        self.requests = 0
+        self.total_latency = 0.0
+        self.last_latency = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.config.async_tasks),
+            timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def download(self, url):
+        host, port = self.config.cache_server
+        params = [("q", f"{url}"), ("u", f"{self.config.user_agent}")]
+        start = time.perf_counter()
+        for attempt in range(self.config.download_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.config.download_backoff * 2 ** (attempt - 1))
+            try:
+                async with self.session.get(
+                        f"http://{host}:{port}/", params=params) as resp:
+                    if (resp.status in RETRY_STATUSES
+                            and attempt < self.config.download_retries):
+                        continue
+                    content = await self._read(resp)
+                    status = resp.status
+                    break
+            except ResponseTooLarge as e:
+                return self._record(start, self._error(
+                    f"Spacetime response too large ({e}) with url {url}.",
+                    resp.status, url))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt < self.config.download_retries:
+                    continue
+                return self._record(start, self._error(
+                    f"Spacetime download error {e!r} with url {url}.",
+                    TRANSPORT_ERROR_STATUS, url))
+        try:
+            if status < 400 and content:
+                return self._record(start, self._decode(url, content))
+        except (EOFError, ValueError) as e:
+            pass
+        return self._record(start, self._error(
+            f"Spacetime Response error <{status}> with url {url}.",
+            status, url))
+
+    async def _read(self, resp):
+        if resp.content_length and resp.content_length > self.max_bytes:
+            raise ResponseTooLarge(f"{resp.content_length} bytes")
+        body = bytearray()
+        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+            body += chunk
+            if len(body) > self.max_bytes:
+                raise ResponseTooLarge(f"more than {self.max_bytes} bytes")
+        return bytes(body)
+
+
+
+_downloaders = local()
 
 def download(url, config, logger=None):
-    host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
-    try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
-    except (EOFError, ValueError) as e:
-        pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
-    return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
-        "url": url})
+    # One pooled Downloader per calling thread.
+    downloader = getattr(_downloaders, "downloader", None)
+    if downloader is None or downloader.config is not config:
+        downloader = _downloaders.downloader = Downloader(config, logger)
+    return downloader.download(url)
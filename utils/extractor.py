@@ -0,0 +1,110 @@
+from urllib.parse import urljoin, urldefrag
+
+from bs4.dammit import EncodingDetector
+from lxml import etree
+
+from utils.tokenizer import StreamingTokenizer
+
+# The text rules below mirror what BeautifulSoup(content, "lxml").get_text()
+# returns, so the extractor gives the same text without building a tree.
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+# Whitespace-only strings are kept as they are inside these tags.
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+# Strings inside these tags are not part of the visible text.
+HIDDEN_TEXT_TAGS = {"script", "style", "template", "rt", "rp"}
+
+
+class PageContent(object):
+    def __init__(self, text_length, tokens, links, parsed_bytes):
+        self.text_length = text_length
+        self.tokens = tokens
+        self.links = links
+        self.parsed_bytes = parsed_bytes
+
+
+class _ExtractTarget(object):
+    ''' lxml parser target that tokenizes the visible text and collects the <a href>
+        links of a page as the parser walks it. '''
+    def __init__(self, url):
+        self.url = url
+        self.pending = []
+        self.tokenizer = StreamingTokenizer()
+        self.text_length = 0
+        self.links = []
+        self.hidden = 0
+        self.preserve = 0
+
+    def _flush(self):
+        # Adjacent data events form one string, ended by any other event.
+        if not self.pending:
+            return
+        data = "".join(self.pending)
+        self.pending = []
+        if not self.preserve and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        if not self.hidden:
+            self.text_length += len(data)
+            self.tokenizer.feed(data)
+
+    def start(self, tag, attrib, nsmap=None):
+        self._flush()
+        if tag in HIDDEN_TEXT_TAGS:
+            self.hidden += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve += 1
+        if tag == "a":
+            href = attrib.get("href")
+            if href is not None and href.strip():
+                link, fragment = urldefrag(urljoin(self.url, str(href)))
+                self.links.append(link)
+
+    def end(self, tag):
+        self._flush()
+        if tag in HIDDEN_TEXT_TAGS:
+            self.hidden -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve -= 1
+
+    def data(self, data):
+        self.pending.append(data)
+
+    def comment(self, text):
+        self._flush()
+
+    def pi(self, target, data=None):
+        self._flush()
+
+    def doctype(self, *args):
+        self._flush()
+
+    def close(self):
+        self._flush()
+        return self
+
+
+def extract(url, content, max_bytes=0):
+    ''' Walk an html page once and return its visible text length, tokens
+        and links (resolved against url, fragments removed). Only the
+        first max_bytes bytes are parsed when max_bytes is set. content is
+        bytes or a memoryview such as Response.content. '''
+    if max_bytes and len(content) > max_bytes:
+        content = memoryview(content)[:max_bytes]
+    if not isinstance(content, bytes):
+        # EncodingDetector and lxml need bytes; only the parsed part of a
+        # memoryview body is copied.
+        content = bytes(content)
+    # Try the candidate encodings in the same order BeautifulSoup does.
+    detector = EncodingDetector(content, is_html=True)
+    error = None
+    for encoding in detector.encodings:
+        target = _ExtractTarget(url)
+        parser = etree.HTMLParser(target=target, encoding=encoding)
+        try:
+            parser.feed(detector.markup)
+            parser.close()
+        except (UnicodeDecodeError, LookupError, etree.ParserError) as e:
+            error = e
+            continue
+        return PageContent(
+            target.text_length, target.tokenizer.close(), target.links, len(content))
+    raise ValueError(f"Could not parse {url}: {error}")
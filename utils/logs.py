@@ -0,0 +1,188 @@
+import atexit
+import json
+import logging
+import os
+import time
+
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
+
+LOG_DIR = "Logs"
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Attributes every LogRecord has; the others came from extra= and are the
+# fields of a structured record.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "log_file"}
+
+
+class JsonFormatter(logging.Formatter):
+    ''' One JSON object per line: time, logger, level, message and the
+        fields passed with extra=. '''
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _Router(logging.Handler):
+    ''' Writes each record to the console and to the file of its logger.
+        Runs on the listener thread, or in the calling thread when logging
+        was stopped. One FileHandler per file, shared by every logger that
+        writes to it. '''
+    def __init__(self):
+        super().__init__()
+        self.files = dict()
+        self.console = logging.StreamHandler()
+        self.console.setLevel(logging.INFO)
+        self.console.setFormatter(logging.Formatter(FORMAT))
+        self.file_formatter = logging.Formatter(FORMAT)
+
+    def add_file(self, filename):
+        # Caller holds _lock.
+        if filename not in self.files:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            handler = logging.FileHandler(os.path.join(LOG_DIR, f"{filename}.log"))
+            handler.setLevel(logging.DEBUG)
+            handler.setFormatter(self.file_formatter)
+            self.files[filename] = handler
+
+    def set_file_formatter(self, formatter):
+        self.file_formatter = formatter
+        for handler in self.files.values():
+            handler.setFormatter(formatter)
+
+    def handle(self, record):
+        handler = self.files.get(getattr(record, "log_file", None))
+        if handler is not None:
+            handler.handle(record)
+        if record.levelno >= self.console.level:
+            self.console.handle(record)
+        return True
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        super().close()
+
+
+class _LoggerHandler(QueueHandler):
+    # Tags records with the file of their logger and queues them.
+    def __init__(self, filename):
+        super().__init__(_queue)
+        self.filename = filename
+
+    def prepare(self, record):
+        # Keep the record as it is; the listener is in this process and
+        # the formatters need exc_info and the extra fields.
+        record.log_file = self.filename
+        return record
+
+    def emit(self, record):
+        record = self.prepare(record)
+        if _listener is None:
+            _router.handle(record)
+        else:
+            self.enqueue(record)
+
+
+_lock = Lock()
+_queue = SimpleQueue()
+_router = _Router()
+_listener = None
+_loggers = dict()
+
+
+def _start():
+    # Caller holds _lock.
+    global _listener
+    if _listener is None:
+        _listener = QueueListener(_queue, _router)
+        _listener.start()
+
+
+def get_logger(name, filename=None):
+    ''' The logger called name, writing INFO and above to the console and
+        to Logs/<filename or name>.log. Records are queued and written by
+        one listener thread. Calling it again returns the same logger
+        without adding handlers. '''
+    logger = _loggers.get(name)
+    if logger is not None:
+        return logger
+    with _lock:
+        if name not in _loggers:
+            filename = filename if filename else name
+            _router.add_file(filename)
+            _start()
+            logger = logging.getLogger(name)
+            logger.setLevel(logging.INFO)
+            logger.addHandler(_LoggerHandler(filename))
+            _loggers[name] = logger
+        return _loggers[name]
+
+
+def configure(config):
+    ''' Apply the logging options of config: LOG_FORMAT for the files. '''
+    with _lock:
+        if config.log_format == "json":
+            _router.set_file_formatter(JsonFormatter())
+        else:
+            _router.set_file_formatter(logging.Formatter(FORMAT))
+
+
+def stop():
+    ''' Write out every queued record and stop the listener thread. Later
+        records are written by the thread logging them. '''
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+    # Records queued while the listener was stopping.
+    while not _queue.empty():
+        _router.handle(_queue.get())
+
+atexit.register(stop)
+
+
+class Sampler(object):
+    ''' Decides which of a frequent kind of record to log, such as one line
+        per download: every every-th one, and at most per_second of them a
+        second (0 for no limit). skipped() tells how many were left out
+        since the last one logged. Not thread safe; give each worker its
+        own. '''
+    def __init__(self, every=1, per_second=0):
+        self.every = max(1, every)
+        self.per_second = per_second
+        self.seen = 0
+        self.dropped = 0
+        self.window = 0
+        self.in_window = 0
+
+    def ready(self):
+        self.seen += 1
+        if (self.seen - 1) % self.every:
+            self.dropped += 1
+            return False
+        if self.per_second:
+            window = int(time.monotonic())
+            if window != self.window:
+                self.window = window
+                self.in_window = 0
+            if self.in_window >= self.per_second:
+                self.dropped += 1
+                return False
+            self.in_window += 1
+        return True
+
+    def skipped(self):
+        dropped, self.dropped = self.dropped, 0
+        return dropped
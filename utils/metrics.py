@@ -0,0 +1,352 @@
+import json
+import os
+import time
+
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Event, Lock, Thread
+
+# Upper bounds in seconds of the histogram buckets, as Prometheus "le".
+BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+    0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Most acquires do not wait at all; they go to their own bucket.
+LOCK_BUCKETS = (0.0,) + BUCKETS
+HELP = {
+    "crawler_stage_seconds": "Time spent in each stage of handling a url.",
+    "crawler_lock_wait_seconds": "Time spent waiting to acquire each lock.",
+    "crawler_pages_total": "Pages downloaded.",
+    "crawler_host_pages_total": "Pages downloaded per host.",
+    "crawler_host_bytes_total": "Page bytes downloaded per host.",
+    "crawler_responses_total": "Cache server responses per status.",
+    "crawler_pages_per_second": "Pages downloaded per second since start.",
+    "crawler_frontier_queued": "Urls waiting in the frontier.",
+    "crawler_frontier_in_flight": "Urls handed out and not completed yet.",
+    "crawler_frontier_hosts": "Hosts with urls waiting in the frontier.",
+    "crawler_host_delay_seconds": "Current politeness delay per host.",
+    "crawler_revisits_total": "Pages fetched again by a recrawl, changed or not.",
+}
+
+
+class Histogram(object):
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = Lock()
+
+    def observe(self, value):
+        idx = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def state(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q, counts=None, count=None):
+        ''' Estimate from the buckets, interpolating inside one. '''
+        if counts is None:
+            counts, _, count = self.state()
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        lower = 0.0
+        for idx, bucket_count in enumerate(counts):
+            upper = self.buckets[idx] if idx < len(self.buckets) else self.buckets[-1]
+            if bucket_count and seen + bucket_count >= rank:
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = upper
+        return self.buckets[-1]
+
+
+class InstrumentedLock(object):
+    ''' Lock wrapper that records how long each acquire waited. It can be
+        passed to threading.Condition. '''
+    def __init__(self, lock, histogram):
+        self.lock = lock
+        self.histogram = histogram
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            self.histogram.observe(0.0)
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        self.histogram.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def _is_owned(self):
+        # Used by Condition; must not count as an acquire.
+        if self.lock.acquire(False):
+            self.lock.release()
+            return False
+        return True
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class NullMetrics(object):
+    ''' Stand-in used when METRICS is off. Every call returns at once and
+        wrap_lock hands back the lock itself, so nothing is measured. '''
+    enabled = False
+
+    @staticmethod
+    def clock():
+        return 0.0
+
+    def stage(self, stage, start):
+        pass
+
+    def observe(self, family, labels, value):
+        pass
+
+    def inc(self, family, labels=(), amount=1):
+        pass
+
+    def gauge(self, family, read, labels=()):
+        pass
+
+    def wrap_lock(self, name, lock):
+        return lock
+
+    def page(self, host, size):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class Metrics(NullMetrics):
+    ''' Histograms, counters and gauges keyed by (family, labels), where
+        labels is a tuple of (name, value) pairs. Served in Prometheus text
+        format on /metrics and as JSON on /metrics.json when port is set,
+        and written as JSON to snapshot_path every snapshot_seconds. '''
+    enabled = True
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, port=0, snapshot_path=None, snapshot_seconds=0, logger=None):
+        self.port = port
+        self.snapshot_path = snapshot_path
+        self.snapshot_seconds = snapshot_seconds
+        self.logger = logger
+        self.lock = Lock()
+        self.histograms = dict()
+        self.counters = dict()
+        self.gauges = dict()
+        self.started = time.monotonic()
+        self.last_snapshot = (self.started, 0)
+        self.server = None
+        self.stopped = Event()
+        self.threads = list()
+
+    def _histogram(self, key, buckets=BUCKETS):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def observe(self, family, labels, value):
+        self._histogram((family, labels)).observe(value)
+
+    def stage(self, stage, start):
+        ''' Record the time since start, a value returned by clock(). '''
+        self._histogram(
+            ("crawler_stage_seconds", (("stage", stage),))
+        ).observe(time.perf_counter() - start)
+
+    def inc(self, family, labels=(), amount=1):
+        key = (family, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, family, read, labels=()):
+        # read() is called each time the metrics are collected.
+        with self.lock:
+            self.gauges[(family, labels)] = read
+
+    def wrap_lock(self, name, lock):
+        return InstrumentedLock(lock, self._histogram(
+            ("crawler_lock_wait_seconds", (("lock", name),)), LOCK_BUCKETS))
+
+    def page(self, host, size):
+        host_labels = (("host", host),)
+        with self.lock:
+            for key, amount in (
+                    (("crawler_pages_total", ()), 1),
+                    (("crawler_host_pages_total", host_labels), 1),
+                    (("crawler_host_bytes_total", host_labels), size)):
+                self.counters[key] = self.counters.get(key, 0) + amount
+
+    def _collect(self):
+        with self.lock:
+            histograms = list(self.histograms.items())
+            counters = dict(self.counters)
+            gauges = list(self.gauges.items())
+        gauge_values = {key: read() for key, read in gauges}
+        uptime = time.monotonic() - self.started
+        gauge_values[("crawler_pages_per_second", ())] = (
+            counters.get(("crawler_pages_total", ()), 0) / uptime if uptime else 0.0)
+        return histograms, counters, gauge_values
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = tuple(labels) + tuple(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def prometheus(self):
+        histograms, counters, gauges = self._collect()
+        lines = list()
+        typed = set()
+
+        def header(family, kind):
+            if family not in typed:
+                typed.add(family)
+                lines.append(f"# HELP {family} {HELP.get(family, family)}")
+                lines.append(f"# TYPE {family} {kind}")
+
+        for (family, labels), histogram in sorted(histograms):
+            header(family, "histogram")
+            counts, total, count = histogram.state()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{family}_bucket{self._labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{family}_bucket{self._labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{family}_sum{self._labels(labels)} {total}")
+            lines.append(f"{family}_count{self._labels(labels)} {count}")
+        for (family, labels), value in sorted(counters.items()):
+            header(family, "counter")
+            lines.append(f"{family}{self._labels(labels)} {value}")
+        for (family, labels), value in sorted(gauges.items()):
+            header(family, "gauge")
+            lines.append(f"{family}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        ''' JSON friendly view: count, sum and p50/p95/p99 per histogram,
+            counters, gauges and the page rate since the last snapshot. '''
+        histograms, counters, gauges = self._collect()
+        now = time.monotonic()
+        pages = counters.get(("crawler_pages_total", ()), 0)
+        last_time, last_pages = self.last_snapshot
+        self.last_snapshot = (now, pages)
+        result = {
+            "uptime_seconds": now - self.started,
+            "pages_per_second_recent": (
+                (pages - last_pages) / (now - last_time) if now > last_time else 0.0),
+            "histograms": {}, "counters": {}, "gauges": {}}
+        for (family, labels), histogram in sorted(histograms):
+            counts, total, count = histogram.state()
+            result["histograms"][family + self._labels(labels)] = {
+                "count": count, "sum": total,
+                "p50": histogram.quantile(0.5, counts, count),
+                "p95": histogram.quantile(0.95, counts, count),
+                "p99": histogram.quantile(0.99, counts, count)}
+        for (family, labels), value in sorted(counters.items()):
+            result["counters"][family + self._labels(labels)] = value
+        for (family, labels), value in sorted(gauges.items()):
+            result["gauges"][family + self._labels(labels)] = value
+        return result
+
+    def write_snapshot(self):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w") as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _snapshot_loop(self):
+        while not self.stopped.wait(self.snapshot_seconds):
+            try:
+                self.write_snapshot()
+            except OSError:
+                if self.logger:
+                    self.logger.exception("Could not write the metrics snapshot.")
+
+    def _handler(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = metrics.prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(metrics.snapshot(), sort_keys=True).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self):
+        if self.port:
+            self.server = ThreadingHTTPServer(("127.0.0.1", self.port), self._handler())
+            self.server.daemon_threads = True
+            self.threads.append(Thread(
+                target=self.server.serve_forever, name="metrics-http", daemon=True))
+            if self.logger:
+                self.logger.info(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+        if self.snapshot_path and self.snapshot_seconds > 0:
+            self.threads.append(Thread(
+                target=self._snapshot_loop, name="metrics-snapshot", daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        for thread in self.threads:
+            thread.join()
+        if self.snapshot_path and self.snapshot_seconds > 0:
+            self.write_snapshot()
+
+
+_metrics = NullMetrics()
+
+def get_metrics():
+    return _metrics
+
+def configure(config, logger=None):
+    ''' Install the registry for this crawl, a NullMetrics when METRICS is
+        off. Call before the frontier and workers are created. '''
+    global _metrics
+    if config.metrics:
+        _metrics = Metrics(
+            config.metrics_port, config.metrics_file,
+            config.metrics_snapshot_seconds, logger)
+    else:
+        _metrics = NullMetrics()
+    return _metrics
@@ -1,14 +1,52 @@
 import pickle
 
+from requests.structures import CaseInsensitiveDict
+
+_NOT_DECODED = object()
+
+
 class Response(object):
-    def __init__(self, resp_dict):
+    ''' A cache server response. url, status and error come from the CBOR
+        dict; the pickled requests.Response in it is only unpickled the
+        first time raw_response, headers or content is used, so error
+        responses are never decoded. A pickle larger than max_body_bytes
+        (0 for no limit) makes the response an error and is never decoded;
+        the pickle is only a little larger than the body it holds. '''
+    def __init__(self, resp_dict, max_body_bytes=0):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        # Seconds spent fetching this response, set by the downloader.
+        self.latency = None
+        self.payload = resp_dict["response"] if "response" in resp_dict else None
+        self._raw_response = _NOT_DECODED if self.payload is not None else None
+        if max_body_bytes and self.payload is not None and len(self.payload) > max_body_bytes:
+            self.error = (
+                f"Response body of about {len(self.payload)} bytes is over "
+                f"{max_body_bytes} bytes.")
+            self.payload = None
+            self._raw_response = None
+
+    @property
+    def raw_response(self):
+        ''' The unpickled requests.Response, None when there is none or the
+            pickle is truncated or malformed. '''
+        if self._raw_response is _NOT_DECODED:
+            try:
+                self._raw_response = pickle.loads(self.payload)
+            except (TypeError, ValueError, EOFError, pickle.UnpicklingError):
+                self._raw_response = None
+        return self._raw_response
+
+    @property
+    def headers(self):
+        raw = self.raw_response
+        return raw.headers if raw is not None else CaseInsensitiveDict()
+
+    @property
+    def content(self):
+        ''' The body as a memoryview, None when there is none. '''
+        raw = self.raw_response
+        if raw is None or raw.content is None:
+            return None
+        return memoryview(raw.content)
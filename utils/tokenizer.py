@@ -1,4 +1,6 @@
+import re
 import sys
+from collections import Counter
 STOPWORDS = {
     "a","about","above","after","again","against","all","am","an","and","any","are",
     "aren't","as","at","be","because","been","before","being","below","between","both",
@@ -19,26 +21,65 @@ STOPWORDS = {
     've', 'll', 'e', 'n', 'o', 'l'
 }
 
-# Time Complexity: O(N), N is the number of characters in the file
-# Space Complexity: O(1) - constant space, processes one token at a time
-# Reads line by line and yields tokens one at a time as a generator
-# which is memory-efficient as it does not store all tokens in RAM
-# this makes it better for processing very large files
-def tokenize(text: str): 
+# Runs of ASCII letters and digits, what isalnum() and isascii() accept
+TOKEN_RE = re.compile(r"[A-Za-z0-9]+")
+
+# Time Complexity: O(N), N is the number of characters in the text
+# Space Complexity: O(W), W is the number of distinct whitespace separated words
+# Whitespace separated words are counted first with Counter, which runs in C,
+# then each distinct word is split into tokens once and its count added to them
+# Gives the same dict, in the same order, as splitting every word one char at a time
+def tokenize(text: str):
+    return _expand_words(Counter(text.split()))
+
+# Time Complexity: O(W), W is the number of distinct words
+# A word that is itself a stopword is dropped whole (e.g. "don't"), otherwise its
+# alphanumeric runs that are not stopwords become tokens
+def _expand_words(word_counts):
     tokens = {}
-    for word in text.split():
+    for word, count in word_counts.items():
         if word.lower() in STOPWORDS:
             continue
-        cur_token = ""
-        for char in word + " ":
-            if char.isalnum() and char.isascii(): # alphanumeric chars
-                cur_token += char
-            else:
-                if cur_token and cur_token.lower() not in STOPWORDS:
-                    tokens[cur_token] = 1 + tokens.get(cur_token, 0)
-                cur_token = ""
+        if word.isalnum() and word.isascii():
+            tokens[word] = tokens.get(word, 0) + count
+            continue
+        for token in TOKEN_RE.findall(word):
+            if token.lower() not in STOPWORDS:
+                tokens[token] = tokens.get(token, 0) + count
     return tokens
 
+# Streaming version of tokenize: feed() text chunks in order, then close()
+# A word cut in two at the end of a chunk is carried over to the next chunk
+# so the result is the same as tokenize("".join(chunks))
+class StreamingTokenizer(object):
+    def __init__(self):
+        self.word_counts = Counter()
+        self.carry = ""
+
+    def feed(self, chunk: str):
+        if not chunk:
+            return
+        if self.carry:
+            chunk = self.carry + chunk
+        words = chunk.split()
+        if words and not chunk[-1].isspace():
+            self.carry = words.pop()
+        else:
+            self.carry = ""
+        self.word_counts.update(words)
+
+    def close(self):
+        if self.carry:
+            self.word_counts[self.carry] += 1
+            self.carry = ""
+        return _expand_words(self.word_counts)
+
+def tokenize_stream(chunks):
+    tokenizer = StreamingTokenizer()
+    for chunk in chunks:
+        tokenizer.feed(chunk)
+    return tokenizer.close()
+
 # Time Complexity: O(N), N is the number of tokens
 # Space Complexity: O(V), V is the number of unique tokens for the frequency dictionary
 # Counts token occurrences from an iterable (works with generators for memory efficiency)